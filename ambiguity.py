@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Ambiguity report - the compact per-file list of rows whose
+originating_system_id occurs in more than one Network Number (for example
+'grinnell:108', which is also inside 'grinnell:1080'), written instead of
+one log warning per row.
+"""
+
+import csv
+import io
+
+from output_writer import atomic_output
+
+
+# Row numbers listed per ID in the ambiguity report
+REPORT_ROW_SAMPLE = 10
+AMBIGUITY_REPORT_SUFFIX = ".ambiguous.csv"
+
+
+def ambiguity_report_path(output_path):
+    """Return the ambiguity report written beside an UPDATED_ file"""
+    return output_path.with_name(output_path.stem + AMBIGUITY_REPORT_SUFFIX)
+
+
+def write_ambiguity_report(path, ambiguous):
+    """
+    Write one line per ambiguous originating_system_id: how many rows use
+    it, the first few row numbers and every Network Number it occurs in.
+    ambiguous is ProcessResult.ambiguous.
+    """
+    with atomic_output(path) as output:
+        text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(['originating_system_id', 'rows', 'row_numbers', 'network_number_count', 'network_numbers'])
+        for orig_id, entry in ambiguous.items():
+            row_numbers = " ".join(str(row) for row in entry['row_numbers'])
+            if entry['rows'] > len(entry['row_numbers']):
+                row_numbers += " ..."
+            writer.writerow([orig_id, entry['rows'], row_numbers, len(entry['network_numbers']),
+                             " | ".join(entry['network_numbers'])])
+        text.flush()
+        # Leave the underlying stream for atomic_output to finish and close
+        text.detach()
@@ -5,12 +5,28 @@ from a network reference CSV file.
 """
 
 import flet as ft
-import pandas as pd
-import os
 from pathlib import Path
 import logging
+import os
+import threading
 from datetime import datetime
 
+from core import (
+    DEFAULT_REFERENCE_CSV_PATH,
+    load_companion,
+    load_reference,
+    log_sidecar_path,
+    process_file,
+    resolve_reference_path,
+    setup_logging,
+)
+from instrumentation import RunMetrics, profile_enabled, profiled
+from lookup_service import SERVICE_ENV_VAR, RemoteMatcher
+from match_cache import MATCH_CACHE_NAME, MatchCache
+from progress import ProcessingCancelled, ThrottledProgress
+from reference_cache import ReferenceCache
+from reference_watch import ReferenceWatcher
+
 
 class AlmaCSVUpdater:
     def __init__(self, page: ft.Page):
@@ -20,7 +36,16 @@ class AlmaCSVUpdater:
         self.page.window_height = 600
         
         self.selected_csv_path = None
-        self.reference_df = None
+        self.reference_matcher = None
+        # Memory-mapped so several open app windows share one copy of the index
+        self.reference_cache = ReferenceCache(mapped=True)
+        self.reference_source_path = None
+        self.reference_watcher = None
+        self.match_cache = None
+        # Held while the reference is loading so a run waits for the launch prefetch
+        self.reference_lock = threading.Lock()
+        self.progress = None
+        self.worker = None
         self.progress_text = ft.Text("")
         self.status_text = ft.Text("", color=ft.Colors.BLUE)
         self.warning_text = ft.Text("", color=ft.Colors.RED)
@@ -30,7 +55,9 @@ class AlmaCSVUpdater:
         self.workflow_dialog = None
         
         # Local network path
-        self.reference_csv_path = "/Volumes/MEDIADB/DGIngest/All-Digital-Items-MMS_ID-with-File-Internal-Path.csv"
+        self.reference_csv_path = DEFAULT_REFERENCE_CSV_PATH
+        # Shared lookup service (lookup_service.py) used instead of a local index, if set
+        self.lookup_service_url = os.environ.get(SERVICE_ENV_VAR, "").strip() or None
         
         # Setup logging
         self.setup_logging()
@@ -39,26 +66,13 @@ class AlmaCSVUpdater:
         
         # Display reference CSV path in UI
         self.reference_path_text.value = f"Reference CSV: {self.reference_csv_path}"
+        
+        # Start fetching the reference from the share while the user picks a file
+        threading.Thread(target=self.load_reference_csv_from_smb, name="reference-prefetch", daemon=True).start()
     
     def setup_logging(self):
         """Setup logging to file and console"""
-        # Create logs directory if it doesn't exist
-        log_dir = Path("logs")
-        log_dir.mkdir(exist_ok=True)
-        
-        # Create log filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        log_file = log_dir / f"alma_csv_updater_{timestamp}.log"
-        
-        # Configure logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file),
-                logging.StreamHandler()
-            ]
-        )
+        log_file = setup_logging()
         
         self.logger = logging.getLogger(__name__)
         self.logger.info("=" * 60)
@@ -93,6 +107,18 @@ class AlmaCSVUpdater:
             disabled=True
         )
         
+        self.extra_columns_checkbox = ft.Checkbox(
+            label="Add file_internal_path and deleted columns from the reference",
+            value=False
+        )
+        
+        self.cancel_button = ft.ElevatedButton(
+            "Cancel",
+            icon=ft.Icons.STOP,
+            on_click=self.cancel_processing,
+            visible=False
+        )
+        
         self.workflow_button = ft.ElevatedButton(
             "Display WORKFLOW Instructions",
             icon=ft.Icons.HELP_OUTLINE,
@@ -113,8 +139,9 @@ class AlmaCSVUpdater:
                     ft.Text("Select a local CSV file to update with MMS IDs:", size=16),
                     ft.Row([self.select_button]),
                     self.selected_file_text,
+                    self.extra_columns_checkbox,
                     ft.Divider(),
-                    ft.Row([self.process_button]),
+                    ft.Row([self.process_button, self.cancel_button]),
                     self.progress_bar,
                     self.progress_text,
                     self.status_text,
@@ -195,55 +222,82 @@ class AlmaCSVUpdater:
             self.logger.error(traceback.format_exc())
             self.update_status(f"Error displaying workflow: {str(ex)}", error=True)
     
-    def load_reference_csv_from_smb(self):
+    def load_reference_csv_from_smb(self, metrics=None):
         """Load the reference CSV file from local network path"""
-        try:
-            self.update_progress("Loading reference CSV from network share...")
-            self.logger.info(f"Loading reference CSV from: {self.reference_csv_path}")
+        with self.reference_lock:
+            # Already loaded by the launch prefetch (or an earlier run)
+            if self.reference_matcher is not None:
+                return True
             
-            csv_path_to_use = None
+            if self.lookup_service_url:
+                return self.connect_lookup_service()
             
-            # Check if the network path exists
-            if not os.path.exists(self.reference_csv_path):
-                warning_msg = f"⚠️  Network reference CSV not found at: {self.reference_csv_path}"
-                self.logger.warning(warning_msg)
-                self.logger.warning("You may need to mount the //Storage/MEDIADB/DGIngest network folder")
-                
-                # Check for local copy in project directory
-                local_csv_name = "All-Digital-Items-MMS_ID-with-File-Internal-Path.csv"
-                local_csv_path = Path(__file__).parent / local_csv_name
+            try:
+                self.update_progress("Loading reference CSV from network share...")
                 
-                if local_csv_path.exists():
-                    csv_path_to_use = str(local_csv_path)
-                    fallback_msg = f"✓ Found local copy: {local_csv_path}"
-                    self.logger.info(fallback_msg)
-                    self.update_progress(fallback_msg)
-                    self.warning_text.value = f"{warning_msg}\n{fallback_msg}\nUsing local copy for processing."
+                # Falls back to a local copy in the project directory if the share is not mounted
+                csv_path_to_use, fallback_warning = resolve_reference_path(self.reference_csv_path)
+                if fallback_warning:
+                    self.update_progress(fallback_warning.splitlines()[-1])
+                    self.warning_text.value = f"{fallback_warning}\nUsing local copy for processing."
                     self.warning_text.color = ft.Colors.ORANGE
                     self.page.update()
-                else:
-                    error_msg = f"Reference CSV not found at network path and no local copy found.\nPlease mount //Storage/MEDIADB/DGIngest or place {local_csv_name} in the project directory."
-                    self.logger.error(error_msg)
-                    raise Exception(error_msg)
-            else:
-                csv_path_to_use = self.reference_csv_path
-            
-            # Read Network Number and MMS Id as strings to preserve format
-            self.reference_df = pd.read_csv(csv_path_to_use, dtype={'Network Number': str, 'MMS Id': str})
-            
-            # Log column names for debugging
-            self.logger.info(f"Reference CSV columns: {list(self.reference_df.columns)}")
-            
-            success_msg = f"Reference CSV loaded: {len(self.reference_df)} records from {csv_path_to_use}"
-            self.update_progress(success_msg)
-            self.logger.info(f"Reference CSV loaded successfully: {len(self.reference_df)} records")
+                
+                # Use the local compiled cache when the share file is unchanged,
+                # otherwise parse the CSV and build the lookup index
+                self.reference_matcher, from_cache = load_reference(csv_path_to_use, self.reference_cache, metrics=metrics)
+                self.reference_source_path = csv_path_to_use
+                
+                # Lookup results from earlier sessions, kept per reference version
+                self.match_cache = MatchCache(self.reference_cache.cache_dir / MATCH_CACHE_NAME,
+                                              self.reference_matcher.snapshot)
+                
+                source = "local cache" if from_cache else csv_path_to_use
+                success_msg = f"Reference CSV loaded: {len(self.reference_matcher)} entries from {source}"
+                self.update_progress(success_msg)
+                
+                # Pick up new Alma exports without restarting the app
+                if self.reference_watcher is None:
+                    self.reference_watcher = ReferenceWatcher(
+                        csv_path_to_use,
+                        self.reference_matcher,
+                        on_reload=self.on_reference_reloaded,
+                        cache=self.reference_cache,
+                    )
+                    self.reference_watcher.start()
+                return True
+                
+            except Exception as e:
+                self.logger.error(f"Error loading reference CSV: {str(e)}")
+                self.update_status(f"Error loading reference CSV: {str(e)}", error=True)
+                return False
+    
+    def connect_lookup_service(self):
+        """Use the lookup service's warm index instead of loading the reference locally"""
+        try:
+            self.update_progress(f"Connecting to lookup service at {self.lookup_service_url}...")
+            self.reference_matcher = RemoteMatcher(self.lookup_service_url)
+            self.reference_path_text.value = (f"Reference CSV: {self.reference_matcher.reference} "
+                                              f"(via lookup service {self.lookup_service_url})")
+            self.update_progress(f"Lookup service ready: {len(self.reference_matcher)} entries")
             return True
-            
         except Exception as e:
-            self.logger.error(f"Error loading reference CSV: {str(e)}")
-            self.update_status(f"Error loading reference CSV: {str(e)}", error=True)
+            self.logger.error(f"Error connecting to lookup service: {str(e)}")
+            self.update_status(f"Error connecting to lookup service {self.lookup_service_url}: {str(e)}", error=True)
             return False
     
+    def on_reference_reloaded(self, matcher, patched):
+        """Swap in a reloaded reference index (called from the watcher thread)"""
+        # Runs already in progress keep the matcher they started with
+        self.reference_matcher = matcher
+        if self.match_cache is not None:
+            # Runs still on the previous matcher keep caching under its snapshot
+            self.match_cache.set_snapshot(matcher.snapshot)
+        reloaded_at = datetime.now().strftime("%H:%M:%S")
+        self.reference_path_text.value = (f"Reference CSV: {self.reference_csv_path} "
+                                          f"(reloaded {reloaded_at}, {len(matcher)} entries)")
+        self.page.update()
+    
     def update_progress(self, message):
         """Update progress text"""
         self.progress_text.value = message
@@ -256,251 +310,79 @@ class AlmaCSVUpdater:
         self.page.update()
         
     def process_csv(self, e):
-        """Process the selected CSV file and update MMS IDs"""
+        """Start processing the selected CSV file on a background worker thread"""
         if not self.selected_csv_path:
             self.update_status("Please select a CSV file first", error=True)
             self.logger.warning("Process attempted without file selection")
             return
-            
+        
+        # Show progress
+        self.progress_bar.visible = True
+        self.process_button.disabled = True
+        self.select_button.disabled = True
+        self.cancel_button.visible = True
+        self.cancel_button.disabled = False
+        self.page.update()
+        
+        # Progress is published at most 10 times per second and doubles as
+        # the cancellation channel for the worker
+        metrics = RunMetrics()
+        self.progress = ThrottledProgress(lambda message: self.publish_progress(message, metrics))
+        self.worker = threading.Thread(target=self.run_processing,
+                                       args=(self.selected_csv_path, self.progress, metrics), daemon=True)
+        self.worker.start()
+    
+    def publish_progress(self, message, metrics):
+        """Update the progress text, timing the UI round trip as its own stage"""
+        with metrics.span('ui_update'):
+            self.update_progress(message)
+    
+    def cancel_processing(self, e):
+        """Ask the background worker to stop at its next progress update"""
+        if self.progress is not None:
+            self.progress.cancel()
+            self.cancel_button.disabled = True
+            self.update_progress("Cancelling...")
+            self.logger.info("Cancellation requested")
+    
+    def run_processing(self, csv_path, progress, metrics):
+        """Process the selected CSV file and update MMS IDs (runs on the worker thread)"""
+        # Set ALMA_PROFILE=1 to save a cProfile dump next to the log file
+        with profiled(log_sidecar_path('.prof'), enabled=profile_enabled()):
+            self._run_processing(csv_path, progress, metrics)
+    
+    def _run_processing(self, csv_path, progress, metrics):
         try:
             self.logger.info("=" * 60)
             self.logger.info("Starting CSV processing")
-            self.logger.info(f"Selected file: {self.selected_csv_path}")
-            
-            # Show progress
-            self.progress_bar.visible = True
-            self.process_button.disabled = True
-            self.select_button.disabled = True
-            self.page.update()
+            self.logger.info(f"Selected file: {csv_path}")
             
             # Load reference CSV if not already loaded
-            if self.reference_df is None:
-                if not self.load_reference_csv_from_smb():
+            if self.reference_matcher is None:
+                if not self.load_reference_csv_from_smb(metrics):
                     return
             
-            # Load the selected CSV
-            self.update_progress("Loading selected CSV file...")
-            self.logger.info("Loading selected CSV file...")
-            # Read mms_id and originating_system_id as strings to preserve format
-            df = pd.read_csv(self.selected_csv_path, dtype={'mms_id': str, 'originating_system_id': str})
-            original_row_count = len(df)
-            self.logger.info(f"Selected CSV loaded: {original_row_count} rows")
-            
-            # Remove completely blank rows
-            df = df.dropna(how='all')
-            blank_rows_removed = original_row_count - len(df)
-            if blank_rows_removed > 0:
-                self.logger.info(f"Removed {blank_rows_removed} blank rows from CSV")
-            
-            self.logger.info(f"Processing {len(df)} non-blank rows")
-            
-            # Check for required columns
-            if 'originating_system_id' not in df.columns:
-                error_msg = "Error: 'originating_system_id' column not found in CSV"
-                self.logger.error(error_msg)
-                self.update_status(error_msg, error=True)
-                return
-                
-            if 'mms_id' not in df.columns:
-                # Add mms_id column if it doesn't exist
-                self.logger.info("Adding 'mms_id' column to CSV")
-                df['mms_id'] = ''
-            
-            # Replace 'nan' strings with empty strings (from reading with dtype=str)
-            df['originating_system_id'] = df['originating_system_id'].replace('nan', '')
-            df['mms_id'] = df['mms_id'].replace('nan', '')
-            
-            # Check reference CSV columns
-            if 'Network Number' not in self.reference_df.columns:
-                error_msg = "Error: 'Network Number' column not found in reference CSV"
-                self.logger.error(error_msg)
-                self.update_status(error_msg, error=True)
-                return
-                
-            if 'MMS Id' not in self.reference_df.columns:
-                error_msg = "Error: 'MMS Id' column not found in reference CSV"
-                self.logger.error(error_msg)
-                self.update_status(error_msg, error=True)
-                return
-            
-            # Create reference data structure for substring matching
-            self.logger.info("Creating MMS ID lookup from reference CSV...")
-            # Store as list of tuples (network_number, mms_id) for substring matching
-            reference_data = []
-            for _, row in self.reference_df.iterrows():
-                network_num = row['Network Number']
-                mms_id = row['MMS Id']
-                # Check if values are not empty strings (after dtype=str conversion)
-                if network_num and network_num != 'nan' and mms_id and mms_id != 'nan':
-                    reference_data.append((str(network_num).strip(), str(mms_id).strip()))
-            
-            self.update_progress(f"Reference data loaded with {len(reference_data)} entries")
-            self.logger.info(f"Reference data loaded with {len(reference_data)} entries")
-            
-            # Log sample entries from reference for debugging
-            sample_entries = reference_data[:3]
-            self.logger.info(f"Sample reference entries (Network Number, MMS Id): {sample_entries}")
-            
-            # Test search for the first originating_system_id to verify matching logic
-            test_id = str(df['originating_system_id'].iloc[0]).strip()
-            test_matches = [net_num for net_num, _ in reference_data if test_id in net_num]
-            self.logger.info(f"Test search for first ID '{test_id}': found {len(test_matches)} matches")
-            if test_matches:
-                self.logger.info(f"Test match example: '{test_matches[0]}'")
-            
-            # Process each row
-            self.logger.info(f"Processing {len(df)} rows...")
-            updated_count = 0
-            skipped_count = 0
-            comment_count = 0
-            not_found_count = 0
-            multiple_matches_count = 0
-            not_found_samples = []  # Collect samples of not found IDs
-            multiple_match_samples = []  # Collect samples of multiple matches
-            
-            total_rows = len(df)
-            for idx, row in df.iterrows():
-                # Update progress
-                if idx % 10 == 0:
-                    self.update_progress(f"Processing row {idx + 1} of {total_rows}...")
-                
-                # Get the first column value to check for comments
-                first_col_name = df.columns[0]
-                first_col_val = str(row[first_col_name]).strip()
-                
-                # Check if row is a comment (first column starts with #)
-                if first_col_val.startswith('#'):
-                    comment_count += 1
-                    self.logger.info(f"Row {idx + 1}: Comment row detected (starts with #), skipping")
-                    continue
-                
-                # Check if mms_id is empty and originating_system_id is valid
-                mms_id_val = str(row['mms_id']).strip()
-                orig_id_val = str(row['originating_system_id']).strip()
-                
-                # Treat "NOT FOUND IN ALMA" entries as empty
-                is_empty_mms_id = (not mms_id_val or 
-                                   mms_id_val == 'nan' or 
-                                   mms_id_val.startswith('NOT FOUND IN ALMA'))
-                
-                if is_empty_mms_id:
-                    if orig_id_val and orig_id_val != 'nan':
-                        # Find Network Numbers that contain the originating_system_id
-                        all_matches = [(net_num, mms_id) for net_num, mms_id in reference_data 
-                                       if orig_id_val in net_num]
-                        
-                        # Deduplicate matches by Network Number to avoid counting duplicates in reference data
-                        # as multiple matches (only different Network Numbers should be considered multiple)
-                        unique_matches = {}
-                        for net_num, mms_id in all_matches:
-                            if net_num not in unique_matches:
-                                unique_matches[net_num] = mms_id
-                        
-                        matches = list(unique_matches.items())
-                        
-                        if len(matches) == 1:
-                            # Exactly one match found
-                            df.at[idx, 'mms_id'] = matches[0][1]
-                            updated_count += 1
-                        elif len(matches) > 1:
-                            # Multiple matches found - ambiguous
-                            multiple_matches_count += 1
-                            if len(multiple_match_samples) < 3:
-                                match_details = f"'{orig_id_val}' found in: {[m[0] for m in matches]}"
-                                multiple_match_samples.append(match_details)
-                            self.logger.warning(f"Row {idx + 1}: Multiple matches for '{orig_id_val}': {[m[0] for m in matches]}")
-                        else:
-                            # No matches found - mark with timestamp
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            not_found_marker = f"NOT FOUND IN ALMA - {timestamp}"
-                            df.at[idx, 'mms_id'] = not_found_marker
-                            not_found_count += 1
-                            if len(not_found_samples) < 5:
-                                not_found_samples.append(orig_id_val)
-                            self.logger.warning(f"Row {idx + 1}: No match found for originating_system_id '{orig_id_val}'")
-                    else:
-                        skipped_count += 1
+            # The service answers from its own current index, so no local match cache
+            match_cache = None if self.lookup_service_url else self.match_cache
+            companion = None
+            if self.extra_columns_checkbox.value:
+                if self.lookup_service_url:
+                    self.logger.warning("⚠️  Extra columns are not available through the lookup service")
                 else:
-                    # Already has mms_id
-                    skipped_count += 1
-            
-            # Log samples of issues for debugging
-            if not_found_samples:
-                self.logger.warning(f"Sample originating_system_id values not found in any Network Number: {not_found_samples}")
-            if multiple_match_samples:
-                self.logger.warning(f"Sample multiple match cases: {multiple_match_samples}")
-            
-            # Save updated CSV
-            self.update_progress("Saving updated CSV...")
-            self.logger.info("Saving updated CSV...")
-            
-            # Remove any trailing blank rows before saving
-            df = df.dropna(how='all')
-            
-            # Create new filename with UPDATED_ prefix
-            original_path = Path(self.selected_csv_path)
-            new_filename = f"UPDATED_{original_path.name}"
-            new_path = original_path.parent / new_filename
-            
-            df.to_csv(new_path, index=False)
-            
-            self.logger.info(f"CSV saved as: {new_path}")
-            
-            # Show results - main status in green
-            result_message = f"Processing complete!\n"
-            if blank_rows_removed > 0:
-                result_message += f"Removed: {blank_rows_removed} blank rows\n"
-            if comment_count > 0:
-                result_message += f"Skipped: {comment_count} comment rows (starting with #)\n"
-            result_message += f"Updated: {updated_count} rows\n"
-            result_message += f"Skipped (already had mms_id or no originating_system_id): {skipped_count} rows\n"
-            result_message += f"Not found in reference: {not_found_count} rows\n"
-            result_message += f"Multiple matches (ambiguous): {multiple_matches_count} rows"
-            
-            # Build warning message in red for not found items
-            warning_message = ""
-            if not_found_count > 0:
-                warning_message += f"⚠️  WARNING: {not_found_count} rows not found in reference:\n"
-                for sample in not_found_samples:
-                    warning_message += f"  - {sample}\n"
-                if not_found_count > len(not_found_samples):
-                    warning_message += f"  ... and {not_found_count - len(not_found_samples)} more\n"
-            
-            if multiple_matches_count > 0:
-                if warning_message:
-                    warning_message += "\n"
-                warning_message += f"⚠️  WARNING: {multiple_matches_count} rows with multiple matches:\n"
-                for sample in multiple_match_samples:
-                    warning_message += f"  - {sample}\n"
-                if multiple_matches_count > len(multiple_match_samples):
-                    warning_message += f"  ... and {multiple_matches_count - len(multiple_match_samples)} more\n"
-            
-            self.logger.info("=" * 60)
-            self.logger.info("Processing complete!")
-            if blank_rows_removed > 0:
-                self.logger.info(f"Removed: {blank_rows_removed} blank rows")
-            if comment_count > 0:
-                self.logger.info(f"Skipped: {comment_count} comment rows (starting with #)")
-            self.logger.info(f"Updated: {updated_count} rows")
-            self.logger.info(f"Skipped (already had mms_id or no originating_system_id): {skipped_count} rows")
-            
-            if not_found_count > 0:
-                self.logger.warning(f"Not found in reference: {not_found_count} rows")
-            else:
-                self.logger.info(f"Not found in reference: {not_found_count} rows")
-            
-            if multiple_matches_count > 0:
-                self.logger.warning(f"Multiple matches (ambiguous): {multiple_matches_count} rows")
-            else:
-                self.logger.info(f"Multiple matches (ambiguous): {multiple_matches_count} rows")
-                
-            self.logger.info(f"File saved as: {new_path}")
-            self.logger.info("=" * 60)
+                    # From now on reloads rebuild the companion index from the same read
+                    self.reference_cache.companion = True
+                    companion = load_companion(self.reference_source_path, self.reference_cache, metrics=metrics)
+            result = process_file(csv_path, self.reference_matcher, progress=progress, metrics=metrics,
+                                  match_cache=match_cache, companion=companion)
             
             # Show status in green, warnings in red
-            self.update_status(result_message, error=False)
-            self.warning_text.value = warning_message
-            self.update_progress(f"Updated CSV saved to: {new_path}")
+            self.update_status(result.result_message(), error=False)
+            self.warning_text.value = result.warning_message()
+            self.update_progress(f"Updated CSV saved to: {result.output_path}")
+            
+        except ProcessingCancelled:
+            self.logger.warning("Processing cancelled by user")
+            self.update_status("Processing cancelled. No updated CSV was saved.", error=True)
             
         except Exception as ex:
             self.logger.error(f"Error processing CSV: {str(ex)}")
@@ -509,7 +391,9 @@ class AlmaCSVUpdater:
             
         finally:
             # Hide progress and re-enable buttons
+            self.progress = None
             self.progress_bar.visible = False
+            self.cancel_button.visible = False
             self.process_button.disabled = False
             self.select_button.disabled = False
             self.page.update()
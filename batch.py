@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Batch processing - runs core.process_file over many input CSVs, optionally
+spread across a pool of worker processes that share one reference index.
+"""
+
+import logging
+import multiprocessing
+import queue
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from core import log_sidecar_path, not_found_timestamp, process_file, process_file_streaming, read_input_csv
+from instrumentation import RunMetrics
+from log_queue import LOG_FORMAT, logging_config, start_logging
+
+
+logger = logging.getLogger(__name__)
+
+# Number of input files read ahead of the one being matched in serial runs
+DEFAULT_PREFETCH = 2
+
+# The reference matcher used by worker processes.  With the fork start method
+# it is inherited copy-on-write from the parent; otherwise it is sent once
+# per worker through the pool initializer, never once per task.  The
+# optional CompanionIndex is shared the same way.
+_worker_matcher = None
+_worker_companion = None
+
+
+def _init_worker(matcher=None, companion=None, log_config=None):
+    global _worker_matcher, _worker_companion
+    if matcher is not None:
+        _worker_matcher = matcher
+        _worker_companion = companion
+        # Spawned workers start with no logging configuration; forked ones
+        # restart the inherited log writer themselves
+        if log_config is not None:
+            start_logging(*log_config)
+        else:
+            logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+
+def _process_one(csv_path, matcher, timestamp, chunksize, frame=None, checkpoint=False, match_cache=None,
+                 companion=None):
+    """Process one file in memory, or streamed in chunks when chunksize is set"""
+    if chunksize:
+        return process_file_streaming(csv_path, matcher, timestamp=timestamp, chunksize=chunksize,
+                                      checkpoint=checkpoint, match_cache=match_cache, companion=companion)
+    return process_file(csv_path, matcher, timestamp=timestamp, frame=frame, match_cache=match_cache,
+                        companion=companion)
+
+
+def _prefetched_inputs(csv_paths, depth):
+    """
+    Yield (csv_path, frame, error) for each input, read up to depth files
+    ahead on a background thread so share latency overlaps with matching.
+    The queue bound caps how many parsed files are held in memory at once.
+    """
+    inputs = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def read_ahead():
+        for csv_path in csv_paths:
+            try:
+                item = (csv_path, read_input_csv(csv_path), None)
+            except Exception as e:
+                item = (csv_path, None, e)
+            # Give up if the consumer has gone away rather than block forever
+            while not stop.is_set():
+                try:
+                    inputs.put(item, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            if stop.is_set():
+                return
+
+    reader = threading.Thread(target=read_ahead, name="input-prefetch", daemon=True)
+    reader.start()
+    try:
+        for _ in csv_paths:
+            yield inputs.get()
+    finally:
+        stop.set()
+
+
+def _process_in_worker(csv_path, timestamp, chunksize, checkpoint, match_cache):
+    return _process_one(csv_path, _worker_matcher, timestamp, chunksize, checkpoint=checkpoint,
+                        match_cache=match_cache, companion=_worker_companion)
+
+
+def _pool_context():
+    """Prefer fork so workers share the parent's index pages; macOS forks are unsafe"""
+    if sys.platform != 'darwin' and 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
+
+
+class BatchSummary:
+    """Per-file results and aggregated counters for a batch run"""
+
+    def __init__(self, metrics=None):
+        self.results = []
+        self.failures = []
+        # Batch-level stages (e.g. reference load); per-file metrics are merged in
+        self.metrics = metrics if metrics is not None else RunMetrics()
+
+    def add(self, result):
+        self.results.append(result)
+        self.metrics.merge(result.metrics)
+
+    def add_failure(self, csv_path, error):
+        self.failures.append((csv_path, error))
+
+    def totals(self):
+        """Return the counters summed over every successfully processed file"""
+        totals = Counter()
+        for result in self.results:
+            totals.update(result.counts())
+        return totals
+
+    def log_summary(self):
+        totals = self.totals()
+        logger.info("=" * 60)
+        logger.info(f"Batch complete: {len(self.results)} of {len(self.results) + len(self.failures)} files updated")
+        logger.info(f"Updated: {totals['updated']} rows")
+        logger.info(f"Skipped (already had mms_id or no originating_system_id): {totals['skipped']} rows")
+        logger.info(f"Skipped: {totals['comment']} comment rows (starting with #)")
+        logger.info(f"Not found in reference: {totals['not_found']} rows")
+        logger.info(f"Multiple matches (ambiguous): {totals['multiple']} rows")
+        for csv_path, error in self.failures:
+            logger.error(f"Failed: {csv_path}: {error}")
+        timing_message = self.metrics.timing_message()
+        if timing_message:
+            # Stage times are summed across files, so may exceed wall time with workers
+            logger.info(timing_message)
+        logger.info("=" * 60)
+        self.metrics.log_summary(jsonl_path=log_sidecar_path('.metrics.jsonl'), files=len(self.results),
+                                 failures=len(self.failures), **totals)
+
+
+def process_files(csv_paths, matcher, workers=1, chunksize=None, metrics=None, prefetch=DEFAULT_PREFETCH,
+                  checkpoint=False, match_cache=None, companion=None):
+    """
+    Process every CSV in csv_paths against one reference matcher.
+
+    With workers > 1 the files are distributed over a process pool.  Output
+    files and counters are identical to a serial run; results are returned
+    in input order as a BatchSummary.  Every file in the batch shares one
+    NOT FOUND IN ALMA timestamp.  With chunksize set, each file is streamed
+    in chunks of that many rows instead of being loaded whole.  Per-file
+    metrics are merged into the summary's metrics (metrics if given).
+
+    Serial in-memory runs read up to prefetch files ahead of the one being
+    matched; prefetch=0 reads each file only when it is processed.  With
+    checkpoint=True (streaming only) interrupted files resume from their
+    checkpoints on the next run.  match_cache, a MatchCache, is shared by
+    every file (and worker) in the batch.  companion, a CompanionIndex,
+    fills the extra output columns of every file.
+    """
+    global _worker_matcher, _worker_companion
+    summary = BatchSummary(metrics)
+    csv_paths = list(csv_paths)
+    timestamp = not_found_timestamp()
+
+    if workers <= 1 or len(csv_paths) <= 1:
+        if prefetch > 0 and not chunksize and len(csv_paths) > 1:
+            inputs = _prefetched_inputs(csv_paths, prefetch)
+        else:
+            inputs = ((csv_path, None, None) for csv_path in csv_paths)
+        while True:
+            with summary.metrics.span('prefetch_wait'):
+                csv_path, frame, error = next(inputs, (None, None, None))
+            if csv_path is None:
+                break
+            logger.info(f"Selected file: {csv_path}")
+            try:
+                if error is not None:
+                    raise error
+                summary.add(_process_one(csv_path, matcher, timestamp, chunksize, frame, checkpoint, match_cache,
+                                         companion))
+            except Exception as e:
+                summary.add_failure(csv_path, str(e))
+                logger.error(f"Error processing CSV {csv_path}: {str(e)}")
+                logger.exception("Full traceback:")
+        return summary
+
+    context = _pool_context()
+    workers = min(workers, len(csv_paths))
+    logger.info(f"Processing {len(csv_paths)} files with {workers} worker processes ({context.get_start_method()})")
+    if context.get_start_method() == 'fork':
+        # Set before the pool forks so children inherit it without pickling
+        _worker_matcher = matcher
+        _worker_companion = companion
+        initargs = ()
+    else:
+        initargs = (matcher, companion, logging_config())
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=initargs) as pool:
+            futures = [pool.submit(_process_in_worker, csv_path, timestamp, chunksize, checkpoint,
+                                   match_cache) for csv_path in csv_paths]
+            for csv_path, future in zip(csv_paths, futures):
+                try:
+                    summary.add(future.result())
+                except Exception as e:
+                    summary.add_failure(csv_path, str(e))
+                    logger.error(f"Error processing CSV {csv_path}: {str(e)}")
+    finally:
+        _worker_matcher = None
+        _worker_companion = None
+    return summary
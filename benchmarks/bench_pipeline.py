@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the matching pipeline - runs headless (no Flet window)
+against synthetic data and reports load time, index build time, match
+throughput and peak memory at each scale.
+
+    python benchmarks/bench_pipeline.py                      # 10k, 100k and 1M rows
+    python benchmarks/bench_pipeline.py --scales 10000 100000 --json results.jsonl
+"""
+
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Benchmarks live beside, not inside, the application modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core import process_file  # noqa: E402
+from matcher import ReferenceMatcher, read_reference_csv  # noqa: E402
+
+from synthetic_data import write_input_csv, write_reference_csv  # noqa: E402
+
+
+DEFAULT_SCALES = [10000, 100000, 1000000]
+
+
+def peak_rss_mb():
+    """Return this process's peak resident set size in MB, if the platform reports it"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_scale(rows, work_dir):
+    """Generate data for one scale, run the pipeline stages and return the measurements"""
+    work_dir = Path(work_dir)
+    reference_csv = work_dir / "reference.csv"
+    input_csv = work_dir / "input.csv"
+
+    start = time.perf_counter()
+    originating_ids = write_reference_csv(reference_csv, rows)
+    write_input_csv(input_csv, rows, originating_ids)
+    generate_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference_df = read_reference_csv(reference_csv)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = ReferenceMatcher.from_dataframe(reference_df)
+    build_seconds = time.perf_counter() - start
+    del reference_df
+
+    start = time.perf_counter()
+    result = process_file(input_csv, matcher, timestamp="BENCHMARK")
+    process_seconds = time.perf_counter() - start
+
+    return {
+        'rows': rows,
+        'generate_s': round(generate_seconds, 3),
+        'reference_load_s': round(load_seconds, 3),
+        'index_build_s': round(build_seconds, 3),
+        'process_s': round(process_seconds, 3),
+        'rows_per_s': round(rows / process_seconds) if process_seconds else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+        'counts': result.counts(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Alma CSV Updater matching pipeline.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES,
+                        help="Reference and input row counts to benchmark (default: %(default)s)")
+    parser.add_argument("--json", help="Append one JSON line per scale to this file")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    # Keep per-row warnings out of the timings
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.single is not None:
+        with tempfile.TemporaryDirectory(prefix="alma_bench_") as work_dir:
+            print(json.dumps(run_scale(args.single, work_dir)))
+        return 0
+
+    print(f"{'rows':>10} {'load s':>8} {'build s':>8} {'process s':>10} {'rows/s':>10} {'peak MB':>8}")
+    for rows in args.scales:
+        # Each scale runs in a fresh interpreter so peak memory is not inherited
+        output = subprocess.run(
+            [sys.executable, __file__, "--single", str(rows)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        measurement = json.loads(output.strip().splitlines()[-1])
+        print(f"{measurement['rows']:>10} {measurement['reference_load_s']:>8} {measurement['index_build_s']:>8} "
+              f"{measurement['process_s']:>10} {measurement['rows_per_s']:>10} {measurement['peak_rss_mb']:>8}")
+        if args.json:
+            with open(args.json, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(measurement) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
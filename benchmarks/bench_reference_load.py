@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Reference load benchmark - compares reading every reference column and
+flattening it with a row loop (the original load path) against the lean
+path in matcher.py, for load time and peak memory.
+
+    python benchmarks/bench_reference_load.py                        # synthetic, 100k and 1M rows
+    python benchmarks/bench_reference_load.py --reference /path/to/All-Digital-Items.csv
+"""
+
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Benchmarks live beside, not inside, the application modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from matcher import pyarrow, read_reference_csv, reference_pairs  # noqa: E402
+
+from bench_pipeline import peak_rss_mb  # noqa: E402
+from synthetic_data import write_reference_csv  # noqa: E402
+
+
+DEFAULT_SCALES = [100000, 1000000]
+MODES = ('full', 'lean')
+
+
+def full_load(csv_path):
+    """The original load: all columns as Python strings, then a per-row filter"""
+    reference_df = pd.read_csv(csv_path, dtype={'Network Number': str, 'MMS Id': str})
+    pairs = []
+    for network_num, mms_id in zip(reference_df['Network Number'], reference_df['MMS Id']):
+        if network_num and network_num != 'nan' and mms_id and mms_id != 'nan':
+            pairs.append((str(network_num).strip(), str(mms_id).strip()))
+    return reference_df, pairs
+
+
+def lean_load(csv_path):
+    reference_df = read_reference_csv(csv_path)
+    return reference_df, reference_pairs(reference_df)
+
+
+def run_mode(mode, csv_path):
+    """Load csv_path one way and return the measurements"""
+    baseline_mb = peak_rss_mb()
+    start = time.perf_counter()
+    reference_df, pairs = full_load(csv_path) if mode == 'full' else lean_load(csv_path)
+    load_seconds = time.perf_counter() - start
+    frame_mb = reference_df.memory_usage(deep=True).sum() / (1024 * 1024)
+    peak_mb = peak_rss_mb()
+    return {
+        'mode': mode,
+        'engine': 'pyarrow' if mode == 'lean' and pyarrow is not None else 'c',
+        'rows': len(reference_df),
+        'pairs': len(pairs),
+        'load_s': round(load_seconds, 3),
+        'frame_mb': round(frame_mb, 1),
+        'peak_rss_mb': round(peak_mb, 1) if peak_mb is not None else None,
+        'load_rss_mb': round(peak_mb - baseline_mb, 1) if peak_mb is not None else None,
+    }
+
+
+def measure(mode, csv_path):
+    # Each measurement runs in a fresh interpreter so peak memory is not inherited
+    output = subprocess.run(
+        [sys.executable, __file__, "--single", mode, str(csv_path)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the full and lean reference CSV load paths.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES,
+                        help="Synthetic reference row counts (default: %(default)s)")
+    parser.add_argument("--reference", help="Benchmark this reference CSV instead of synthetic data")
+    parser.add_argument("--json", help="Append one JSON line per measurement to this file")
+    parser.add_argument("--single", nargs=2, metavar=("MODE", "CSV"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.single is not None:
+        mode, csv_path = args.single
+        print(json.dumps(run_mode(mode, csv_path)))
+        return 0
+
+    print(f"{'mode':>6} {'engine':>8} {'rows':>10} {'pairs':>10} {'load s':>8} {'frame MB':>9} {'load MB':>8}")
+    with tempfile.TemporaryDirectory(prefix="alma_bench_") as work_dir:
+        if args.reference:
+            csv_paths = [Path(args.reference)]
+        else:
+            csv_paths = []
+            for rows in args.scales:
+                csv_path = Path(work_dir) / f"reference_{rows}.csv"
+                write_reference_csv(csv_path, rows)
+                csv_paths.append(csv_path)
+
+        for csv_path in csv_paths:
+            for mode in MODES:
+                measurement = measure(mode, csv_path)
+                print(f"{measurement['mode']:>6} {measurement['engine']:>8} {measurement['rows']:>10} "
+                      f"{measurement['pairs']:>10} {measurement['load_s']:>8} {measurement['frame_mb']:>9} "
+                      f"{measurement['load_rss_mb']:>8}")
+                if args.json:
+                    with open(args.json, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(measurement) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for the benchmark suite - writes reference and
+input CSVs shaped like the real Alma export and DG ingest sheets.
+
+    python benchmarks/synthetic_data.py --reference-rows 100000 --input-rows 100000 --out /tmp/bench
+"""
+
+import argparse
+import csv
+import random
+from pathlib import Path
+
+
+REFERENCE_HEADER = ['MMS Id', 'Network Number', 'Bibliographic Lifecycle', 'Collection Name',
+                    'Suppressed From Discovery', 'File Internal Path']
+INPUT_HEADER = ['originating_system_id', 'dc:title', 'dc:type', 'mms_id', 'file_name_1',
+                'dc:identifier', 'dc:creator', 'dc:description', 'dc:date']
+
+
+def _mms_id(n):
+    return f"9910{n:09d}04641"
+
+
+def _file_path(rng, obj_id):
+    hex_dirs = "/".join(f"{rng.randrange(256):02X}" for _ in range(16))
+    return f"{hex_dirs}/grinnell_{obj_id}_OBJ.jpg"
+
+
+def _network_number(rng, n, mms_id):
+    """Return (network_number, originating_id) in one of the real export's shapes"""
+    shape = rng.random()
+    if shape < 0.55:
+        return f"alma:01GCL_INST/bibs/{mms_id}; http://hdl.handle.net/11084/{n}; grinnell:{n}", f"grinnell:{n}"
+    if shape < 0.70:
+        return f"grinnell:{n}p; grinnell:{n}", f"grinnell:{n}"
+    if shape < 0.80:
+        dg_id = 1700000000 + n
+        return f"http://hdl.handle.net/11084/{dg_id}; dg_{dg_id}", f"dg_{dg_id}"
+    if shape < 0.90:
+        return f"alma:01GCL_INST/bibs/{mms_id}; grinnell:{n}; http://hdl.handle.net/11084/{n}", f"grinnell:{n}"
+    return (f"alma:01GCL_INST/bibs/{mms_id}; http://hdl.handle.net/11084/{n}; ms{n % 97}_ihpc_desa{n}; grinnell:{n}",
+            f"grinnell:{n}")
+
+
+def write_reference_csv(path, rows, seed=1):
+    """
+    Write a synthetic reference CSV with about `rows` rows.
+
+    Objects have 1-3 rows each (one per file, repeating the MMS Id and
+    Network Number), as in the real export.  Returns the originating IDs
+    that exist in the reference.
+    """
+    rng = random.Random(seed)
+    originating_ids = []
+    written = 0
+    n = 100
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(REFERENCE_HEADER)
+        while written < rows:
+            n += 1
+            mms_id = _mms_id(n)
+            network_number, originating_id = _network_number(rng, n, mms_id)
+            originating_ids.append(originating_id)
+            lifecycle = 'Deleted' if rng.random() < 0.01 else 'In Repository'
+            for _ in range(min(rng.choice((1, 1, 2, 3)), rows - written)):
+                writer.writerow([mms_id, network_number, lifecycle, '', 'No', _file_path(rng, n)])
+                written += 1
+    return originating_ids
+
+
+def write_input_csv(path, rows, originating_ids, seed=2):
+    """
+    Write a synthetic input CSV mixing lookups, unmatched IDs, prefilled
+    mms_ids, comment rows, blank originating IDs and blank rows.
+    """
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(INPUT_HEADER)
+        for i in range(rows):
+            kind = rng.random()
+            originating_id = rng.choice(originating_ids)
+            mms_id = ''
+            if kind < 0.02:
+                writer.writerow([''] * len(INPUT_HEADER))
+                continue
+            if kind < 0.04:
+                originating_id = f"# comment {i}"
+            elif kind < 0.10:
+                originating_id = f"dg_{rng.randrange(10**9, 10**10)}"
+            elif kind < 0.15:
+                originating_id = ''
+            elif kind < 0.25:
+                mms_id = _mms_id(rng.randrange(10**6))
+            elif kind < 0.30:
+                mms_id = 'NOT FOUND IN ALMA - 2025-01-01 00:00:00'
+            writer.writerow([originating_id, f"Photograph {i}", 'image', mms_id, f"IMG_{i}.jpg",
+                             originating_id, 'Office of Communications', f"Synthetic row {i}", '2009-05-18'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic reference and input CSVs.")
+    parser.add_argument("--reference-rows", type=int, default=100000)
+    parser.add_argument("--input-rows", type=int, default=100000)
+    parser.add_argument("--out", default=".", help="Output directory (default: current directory)")
+    args = parser.parse_args(argv)
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    originating_ids = write_reference_csv(out / "reference.csv", args.reference_rows)
+    write_input_csv(out / "input.csv", args.input_rows, originating_ids)
+    print(f"Wrote {out / 'reference.csv'} and {out / 'input.csv'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Checkpoints - a sidecar file next to a streaming run's partial output that
+records how far the run got, so an interrupted run can pick up where it
+stopped instead of starting over.
+"""
+
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from reference_cache import file_fingerprint
+
+
+# Bump whenever the checkpoint contents change
+CHECKPOINT_VERSION = 3
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+
+class StreamCheckpoint:
+    """
+    Progress of one process_file_streaming run.
+
+    The checkpoint is only rewritten after the output has been flushed to
+    disk, so the output is always at least as far along as the checkpoint
+    says; on resume the output is truncated back to the recorded size and
+    anything written after the last checkpoint is redone.
+
+    reference is the matcher's reference snapshot; rows after the resume
+    point must be matched against the same reference as those before it.
+    extra_columns records whether the companion columns are being added,
+    since the partial output's header depends on it.
+    """
+
+    def __init__(self, csv_path, output_path, chunksize, reference=None, extra_columns=False):
+        self.csv_path = csv_path
+        self.output_path = Path(output_path)
+        self.path = self.output_path.with_name(self.output_path.name + CHECKPOINT_SUFFIX)
+        self.chunksize = chunksize
+        self.reference = reference
+        self.extra_columns = extra_columns
+        self.logger = logging.getLogger(__name__)
+
+    def load(self):
+        """Return the saved state if it belongs to this input and output, else None"""
+        if not self.path.exists():
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable checkpoint {self.path}: {str(e)}")
+            return None
+
+        if state.get('version') != CHECKPOINT_VERSION:
+            reason = "it was written by another version"
+        elif state.get('source') != file_fingerprint(self.csv_path):
+            reason = "the input file has changed"
+        elif state.get('chunksize') != self.chunksize:
+            reason = f"it was written with chunksize {state.get('chunksize')}"
+        elif state.get('reference') != self.reference:
+            reason = "the reference has changed"
+        elif state.get('extra_columns') != self.extra_columns:
+            reason = f"it was written {'with' if state.get('extra_columns') else 'without'} the extra columns"
+        elif not self.output_path.exists() or self.output_path.stat().st_size < state['output_bytes']:
+            reason = "the partial output is missing or shorter than recorded"
+        else:
+            return state
+        self.logger.warning(f"⚠️  Not resuming from {self.path}: {reason}")
+        return None
+
+    def save(self, output, chunks_done, rows_read, timestamp, result):
+        """Flush output to disk and record that chunks_done chunks are complete"""
+        output.flush()
+        os.fsync(output.fileno())
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'source': file_fingerprint(self.csv_path),
+            'chunksize': self.chunksize,
+            'reference': self.reference,
+            'extra_columns': self.extra_columns,
+            'timestamp': timestamp,
+            'chunks_done': chunks_done,
+            'rows_read': rows_read,
+            'output_bytes': output.tell(),
+            'result': result.state(),
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def clear(self):
+        """Remove the checkpoint once the output is complete"""
+        if self.path.exists():
+            self.path.unlink()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Alma CSV Updater - headless command-line batch mode.
+
+Loads and indexes the reference CSV once, then writes an UPDATED_ copy of
+every input CSV given as a file, directory or glob pattern.
+
+    python cli.py "Photos_For_DG/*.csv" other.csv
+"""
+
+import argparse
+import glob
+import logging
+import sys
+from pathlib import Path
+
+from batch import DEFAULT_PREFETCH, process_files
+from core import (
+    DEFAULT_CHUNKSIZE,
+    DEFAULT_REFERENCE_CSV_PATH,
+    UPDATED_PREFIX,
+    load_companion,
+    load_reference,
+    resolve_reference_path,
+    setup_logging,
+)
+from instrumentation import RunMetrics, profile_enabled, profiled
+from match_cache import MATCH_CACHE_NAME, MatchCache
+from reference_cache import ReferenceCache
+
+
+def expand_input_paths(patterns):
+    """Expand files, directories and glob patterns into a sorted list of input CSVs"""
+    paths = []
+    for pattern in patterns:
+        candidates = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for candidate in candidates:
+            candidate = Path(candidate)
+            if candidate.is_dir():
+                paths.extend(sorted(candidate.glob("*.csv")))
+            else:
+                paths.append(candidate)
+
+    # Never feed our own output back in, and only process each file once
+    unique_paths = []
+    seen = set()
+    for path in paths:
+        if path.name.startswith(UPDATED_PREFIX) or path.suffix.lower() != ".csv":
+            continue
+        key = path.resolve()
+        if key not in seen:
+            seen.add(key)
+            unique_paths.append(path)
+    return unique_paths
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Update the mms_id column of CSV files from the Alma reference CSV."
+    )
+    parser.add_argument("inputs", nargs="+",
+                        help="CSV files, directories or glob patterns to process")
+    parser.add_argument("--reference", default=DEFAULT_REFERENCE_CSV_PATH,
+                        help="Reference CSV path (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always re-read the reference CSV instead of using the local cache")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes for multi-file runs (default: %(default)s)")
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH,
+                        help="Input files to read ahead while matching in serial runs; 0 disables (default: %(default)s)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream each input in chunks to keep memory bounded for very large files")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="Stream with a checkpoint after every chunk; rerunning resumes interrupted files")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="Rows per chunk in --stream mode (default: %(default)s)")
+    parser.add_argument("--cache-dir", default="cache",
+                        help="Directory for the compiled reference cache (default: %(default)s)")
+    parser.add_argument("--no-match-cache", action="store_true",
+                        help="Do not reuse or record lookup results in the local match cache")
+    parser.add_argument("--mapped-index", action="store_true",
+                        help="Cache the reference as a memory-mapped binary index shared by all worker processes")
+    parser.add_argument("--extra-columns", action="store_true",
+                        help="Add file_internal_path and deleted columns from the reference to the output")
+    parser.add_argument("--profile", action="store_true",
+                        help="Run under cProfile and save the stats next to the log file (also ALMA_PROFILE=1)")
+    return parser
+
+
+def main(argv=None):
+    """Command-line entry point; returns a process exit code"""
+    args = build_parser().parse_args(argv)
+
+    log_file = setup_logging()
+    logger = logging.getLogger(__name__)
+    logger.info("=" * 60)
+    logger.info("Alma CSV Updater batch run started")
+    logger.info(f"Log file: {log_file}")
+    logger.info("=" * 60)
+
+    input_paths = expand_input_paths(args.inputs)
+    if not input_paths:
+        logger.error("No input CSV files matched")
+        return 2
+
+    with profiled(log_file.with_suffix('.prof'), enabled=args.profile or profile_enabled()):
+        metrics = RunMetrics()
+        try:
+            reference_path, fallback_warning = resolve_reference_path(args.reference)
+            if fallback_warning:
+                logger.warning("Using local copy for processing.")
+            cache = ReferenceCache(args.cache_dir, mapped=args.mapped_index, companion=args.extra_columns)
+            matcher, _ = load_reference(reference_path, cache, use_cache=not args.no_cache, metrics=metrics)
+            match_cache = None
+            if not args.no_match_cache:
+                # Results are stored under the matcher's own reference snapshot
+                match_cache = MatchCache(Path(args.cache_dir) / MATCH_CACHE_NAME, matcher.snapshot)
+            companion = None
+            if args.extra_columns:
+                companion = load_companion(reference_path, cache, use_cache=not args.no_cache, metrics=metrics)
+        except Exception as e:
+            logger.error(f"Error loading reference CSV: {str(e)}")
+            return 2
+
+        # Checkpoints record completed chunks, so they imply streaming
+        chunksize = args.chunksize if args.stream or args.checkpoint else None
+        summary = process_files(input_paths, matcher, workers=args.workers, chunksize=chunksize, metrics=metrics,
+                                prefetch=args.prefetch, checkpoint=args.checkpoint, match_cache=match_cache,
+                                companion=companion)
+        summary.log_summary()
+    return 1 if summary.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
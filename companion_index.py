@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Companion index - the reverse and side lookups that the reference CSV
+supports besides originating_system_id -> MMS Id: every Network Number of an
+MMS Id, and the File Internal Paths and Bibliographic Lifecycle of each
+Network Number.  Used to fill optional extra columns in the UPDATED_ file.
+"""
+
+import pandas as pd
+
+
+# Reference columns the companion index reads in addition to REFERENCE_COLUMNS
+COMPANION_COLUMNS = ('File Internal Path', 'Bibliographic Lifecycle')
+DELETED_LIFECYCLE = "Deleted"
+
+# Output columns filled by CompanionIndex.fill_columns
+FILE_PATH_COLUMN = "file_internal_path"
+DELETED_COLUMN = "deleted"
+# Separator between several file paths in one cell
+PATH_SEPARATOR = "; "
+
+
+def _grouped(frame, key, value):
+    """Return {key: (value, ...)} with the distinct non-empty values in reference order"""
+    frame = frame.loc[(frame[key] != '') & (frame[value] != ''), [key, value]].drop_duplicates()
+    grouped = {}
+    for key_value, value_value in zip(frame[key].tolist(), frame[value].tolist()):
+        grouped.setdefault(key_value, []).append(value_value)
+    return {key_value: tuple(values) for key_value, values in grouped.items()}
+
+
+class CompanionIndex:
+    """
+    MMS Id -> Network Numbers and Network Number -> File Internal Paths /
+    Bibliographic Lifecycles, built from the same reference frame as the
+    ReferenceMatcher.  Columns missing from the reference leave the
+    corresponding lookups empty.
+    """
+
+    def __init__(self, mms_networks, network_paths, network_lifecycles):
+        self.mms_networks = mms_networks
+        self.network_paths = network_paths
+        self.network_lifecycles = network_lifecycles
+
+    @classmethod
+    def from_dataframe(cls, reference_df):
+        """Build the index from a reference DataFrame read as strings"""
+        frame = pd.DataFrame({
+            column: reference_df[column].fillna('').astype(str).str.strip().replace('nan', '')
+            for column in ('Network Number', 'MMS Id') + COMPANION_COLUMNS
+            if column in reference_df.columns
+        })
+        columns = set(frame.columns)
+        return cls(
+            _grouped(frame, 'MMS Id', 'Network Number'),
+            _grouped(frame, 'Network Number', 'File Internal Path') if 'File Internal Path' in columns else {},
+            _grouped(frame, 'Network Number', 'Bibliographic Lifecycle')
+            if 'Bibliographic Lifecycle' in columns else {},
+        )
+
+    def __len__(self):
+        return len(self.mms_networks)
+
+    def network_numbers_for(self, mms_id):
+        """Return every Network Number recorded for mms_id"""
+        return list(self.mms_networks.get(mms_id, ()))
+
+    def file_paths_for(self, mms_id):
+        """Return the distinct File Internal Paths of every Network Number of mms_id"""
+        paths = {}
+        for network_num in self.mms_networks.get(mms_id, ()):
+            paths.update(dict.fromkeys(self.network_paths.get(network_num, ())))
+        return list(paths)
+
+    def lifecycles_for(self, mms_id):
+        """Return the distinct Bibliographic Lifecycles of every Network Number of mms_id"""
+        lifecycles = {}
+        for network_num in self.mms_networks.get(mms_id, ()):
+            lifecycles.update(dict.fromkeys(self.network_lifecycles.get(network_num, ())))
+        return list(lifecycles)
+
+    def is_deleted(self, mms_id):
+        """Return True if any reference entry of mms_id is in the Deleted lifecycle"""
+        return DELETED_LIFECYCLE in self.lifecycles_for(mms_id)
+
+    def fill_columns(self, df):
+        """
+        Set the file_internal_path and deleted columns of df in place for
+        every row whose mms_id is in the index.  Each distinct MMS Id is
+        looked up once; other rows keep any value they already had.
+        """
+        for column in (FILE_PATH_COLUMN, DELETED_COLUMN):
+            if column not in df.columns:
+                df[column] = ''
+        mms_id_vals = df['mms_id'].fillna('').astype(str).str.strip()
+        known = mms_id_vals[mms_id_vals.isin(self.mms_networks.keys())]
+        if known.empty:
+            return
+        unique_ids = known.unique()
+        paths = {mms_id: PATH_SEPARATOR.join(self.file_paths_for(mms_id)) for mms_id in unique_ids}
+        deleted = {mms_id: "Yes" if self.is_deleted(mms_id) else "No" for mms_id in unique_ids}
+        df.loc[known.index, FILE_PATH_COLUMN] = known.map(paths).to_numpy()
+        df.loc[known.index, DELETED_COLUMN] = known.map(deleted).to_numpy()
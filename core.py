@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+"""
+Alma CSV Updater core - the UI-free reference loading, matching and update
+logic shared by the Flet app and the command-line batch mode.
+"""
+
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from ambiguity import REPORT_ROW_SAMPLE, ambiguity_report_path, write_ambiguity_report
+from checkpoint import StreamCheckpoint
+from instrumentation import RunMetrics
+from log_queue import report_rows, row_report_path, start_logging
+from output_writer import finish_output, open_output, partial_path, write_csv, write_frame
+from reference_cache import ReferenceCache
+
+
+DEFAULT_REFERENCE_CSV_PATH = "/Volumes/MEDIADB/DGIngest/All-Digital-Items-MMS_ID-with-File-Internal-Path.csv"
+LOCAL_REFERENCE_CSV_NAME = "All-Digital-Items-MMS_ID-with-File-Internal-Path.csv"
+UPDATED_PREFIX = "UPDATED_"
+NOT_FOUND_MARKER = "NOT FOUND IN ALMA"
+# Rows per chunk in streaming mode
+DEFAULT_CHUNKSIZE = 50000
+# originating_system_ids per matcher.match_many call
+MATCH_BATCH_SIZE = 5000
+# Per-run report of every not-found and ambiguous row, next to the log file
+ROW_REPORT_SUFFIX = ".rows.jsonl"
+
+logger = logging.getLogger(__name__)
+
+# Log file of this process, set by setup_logging; metrics and profiles are
+# written next to it
+_log_file = None
+
+
+def setup_logging(log_dir="logs"):
+    """
+    Setup logging to file and console, returning the log file path.  Records
+    are written by a background thread (see log_queue), and unresolved rows
+    go to a .rows.jsonl report next to the log file instead of the log.
+    """
+    # Create logs directory if it doesn't exist
+    log_dir = Path(log_dir)
+    log_dir.mkdir(exist_ok=True)
+
+    # Create log filename with timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_file = log_dir / f"alma_csv_updater_{timestamp}.log"
+
+    start_logging(log_file, log_file.with_suffix(ROW_REPORT_SUFFIX))
+
+    global _log_file
+    _log_file = log_file
+    return log_file
+
+
+def log_sidecar_path(suffix):
+    """Return a path next to the current log file (e.g. suffix '.prof'), or None without a log file"""
+    if _log_file is None:
+        return None
+    return _log_file.with_suffix(suffix)
+
+
+def resolve_reference_path(reference_csv_path=DEFAULT_REFERENCE_CSV_PATH):
+    """
+    Return (path, warning) for the reference CSV to use.
+
+    Falls back to a local copy in the project directory when the network
+    path is not mounted; warning is None unless the fallback was used.
+    """
+    if os.path.exists(reference_csv_path):
+        return reference_csv_path, None
+
+    warning_msg = f"⚠️  Network reference CSV not found at: {reference_csv_path}"
+    logger.warning(warning_msg)
+    logger.warning("You may need to mount the //Storage/MEDIADB/DGIngest network folder")
+
+    # Check for local copy in project directory
+    local_csv_path = Path(__file__).parent / LOCAL_REFERENCE_CSV_NAME
+    if local_csv_path.exists():
+        fallback_msg = f"✓ Found local copy: {local_csv_path}"
+        logger.info(fallback_msg)
+        return str(local_csv_path), f"{warning_msg}\n{fallback_msg}"
+
+    error_msg = f"Reference CSV not found at network path and no local copy found.\nPlease mount //Storage/MEDIADB/DGIngest or place {LOCAL_REFERENCE_CSV_NAME} in the project directory."
+    logger.error(error_msg)
+    raise FileNotFoundError(error_msg)
+
+
+def load_reference(csv_path, cache=None, use_cache=True, metrics=None):
+    """Return (matcher, from_cache) for a reference CSV, using the local compiled cache"""
+    logger.info(f"Loading reference CSV from: {csv_path}")
+    if cache is None:
+        cache = ReferenceCache()
+    matcher, from_cache = cache.load_or_build(csv_path, use_cache=use_cache, metrics=metrics)
+    logger.info(f"Reference CSV loaded successfully: {len(matcher)} entries")
+    return matcher, from_cache
+
+
+def load_companion(csv_path, cache=None, use_cache=True, metrics=None):
+    """Return the CompanionIndex for a reference CSV, reusing the load_reference read when possible"""
+    if cache is None:
+        cache = ReferenceCache(companion=True)
+    companion = cache.load_or_build_companion(csv_path, use_cache=use_cache, metrics=metrics)
+    logger.info(f"Companion index loaded: {len(companion)} MMS Ids")
+    return companion
+
+
+def updated_output_path(csv_path):
+    """Return the UPDATED_ output path for an input CSV"""
+    original_path = Path(csv_path)
+    return original_path.parent / f"{UPDATED_PREFIX}{original_path.name}"
+
+
+class ProcessResult:
+    """Counters and samples collected while updating one CSV file"""
+
+    def __init__(self, csv_path, metrics=None):
+        self.csv_path = Path(csv_path)
+        self.output_path = None
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.blank_rows_removed = 0
+        self.updated_count = 0
+        self.skipped_count = 0
+        self.comment_count = 0
+        self.not_found_count = 0
+        self.multiple_matches_count = 0
+        self.not_found_samples = []  # Collect samples of not found IDs
+        self.multiple_match_samples = []  # Collect samples of multiple matches
+        # Ambiguous originating_system_id -> row count, first row numbers and Network Numbers
+        self.ambiguous = {}
+        self.ambiguity_report_path = None
+        # Per-run report listing every unresolved row, if any were reported
+        self.row_report_path = None
+
+    def counts(self):
+        """Return the run counters as a dict"""
+        return {
+            'blank_rows_removed': self.blank_rows_removed,
+            'updated': self.updated_count,
+            'skipped': self.skipped_count,
+            'comment': self.comment_count,
+            'not_found': self.not_found_count,
+            'multiple': self.multiple_matches_count,
+        }
+
+    # Counter attributes saved in checkpoints, so a resumed run reports the same totals
+    _STATE_FIELDS = ('blank_rows_removed', 'updated_count', 'skipped_count', 'comment_count',
+                     'not_found_count', 'multiple_matches_count', 'not_found_samples', 'multiple_match_samples',
+                     'ambiguous')
+
+    def state(self):
+        """Return the counters and samples as a JSON-serializable dict"""
+        return {field: getattr(self, field) for field in self._STATE_FIELDS}
+
+    def restore(self, state):
+        """Continue counting from a state() saved by an interrupted run"""
+        for field in self._STATE_FIELDS:
+            setattr(self, field, state[field])
+
+    def result_message(self):
+        """Return the main results text shown in green"""
+        result_message = f"Processing complete!\n"
+        if self.blank_rows_removed > 0:
+            result_message += f"Removed: {self.blank_rows_removed} blank rows\n"
+        if self.comment_count > 0:
+            result_message += f"Skipped: {self.comment_count} comment rows (starting with #)\n"
+        result_message += f"Updated: {self.updated_count} rows\n"
+        result_message += f"Skipped (already had mms_id or no originating_system_id): {self.skipped_count} rows\n"
+        result_message += f"Not found in reference: {self.not_found_count} rows\n"
+        result_message += f"Multiple matches (ambiguous): {self.multiple_matches_count} rows"
+        timing_message = self.metrics.timing_message()
+        if timing_message:
+            result_message += f"\n{timing_message}"
+        return result_message
+
+    def warning_message(self):
+        """Return the warning text shown in red for not found and ambiguous rows"""
+        warning_message = ""
+        if self.not_found_count > 0:
+            warning_message += f"⚠️  WARNING: {self.not_found_count} rows not found in reference:\n"
+            for sample in self.not_found_samples:
+                warning_message += f"  - {sample}\n"
+            if self.not_found_count > len(self.not_found_samples):
+                warning_message += f"  ... and {self.not_found_count - len(self.not_found_samples)} more\n"
+            if self.row_report_path is not None:
+                warning_message += f"  Every not-found row is listed in: {self.row_report_path}\n"
+
+        if self.multiple_matches_count > 0:
+            if warning_message:
+                warning_message += "\n"
+            warning_message += f"⚠️  WARNING: {self.multiple_matches_count} rows with multiple matches:\n"
+            for sample in self.multiple_match_samples:
+                warning_message += f"  - {sample}\n"
+            if self.multiple_matches_count > len(self.multiple_match_samples):
+                warning_message += f"  ... and {self.multiple_matches_count - len(self.multiple_match_samples)} more\n"
+            if self.ambiguity_report_path is not None:
+                warning_message += f"  All ambiguous IDs are listed in: {self.ambiguity_report_path}\n"
+        return warning_message
+
+    def log_summary(self):
+        """Write the end-of-run summary to the log"""
+        logger.info("=" * 60)
+        logger.info("Processing complete!")
+        if self.blank_rows_removed > 0:
+            logger.info(f"Removed: {self.blank_rows_removed} blank rows")
+        if self.comment_count > 0:
+            logger.info(f"Skipped: {self.comment_count} comment rows (starting with #)")
+        logger.info(f"Updated: {self.updated_count} rows")
+        logger.info(f"Skipped (already had mms_id or no originating_system_id): {self.skipped_count} rows")
+
+        if self.not_found_count > 0:
+            logger.warning(f"Not found in reference: {self.not_found_count} rows")
+        else:
+            logger.info(f"Not found in reference: {self.not_found_count} rows")
+
+        if self.multiple_matches_count > 0:
+            logger.warning(f"Multiple matches (ambiguous): {self.multiple_matches_count} rows")
+        else:
+            logger.info(f"Multiple matches (ambiguous): {self.multiple_matches_count} rows")
+
+        logger.info(f"File saved as: {self.output_path}")
+        logger.info("=" * 60)
+        self.metrics.log_summary(jsonl_path=log_sidecar_path('.metrics.jsonl'),
+                                 file=str(self.csv_path), **self.counts())
+
+
+def _no_progress(message, done=None, total=None):
+    pass
+
+
+def _stripped(column):
+    """Return a column as stripped strings, with missing values as ''"""
+    return column.fillna('').astype(str).str.strip()
+
+
+def update_mms_ids(df, matcher, result, timestamp, progress=_no_progress, match_cache=None):
+    """
+    Fill empty mms_id cells of df in place and add the row counts to result.
+
+    Rows are classified with whole-column operations; each distinct
+    originating_system_id that needs a lookup is matched only once and the
+    resolved values are written back in a single assignment.  IDs found in
+    match_cache (a MatchCache) skip the matcher, and new results are added
+    to it.  Ambiguous rows are collected in
+    result.ambiguous for the ambiguity report, and every unresolved row is
+    queued for the run's row report, rather than logged one by one.
+    """
+    # Comment rows (first column starts with #) are left untouched
+    is_comment = _stripped(df.iloc[:, 0]).str.startswith('#')
+    for idx in df.index[is_comment]:
+        logger.info(f"Row {idx + 1}: Comment row detected (starts with #), skipping")
+
+    # Treat "NOT FOUND IN ALMA" entries as empty
+    mms_id_vals = _stripped(df['mms_id'])
+    is_empty_mms_id = (mms_id_vals == '') | (mms_id_vals == 'nan') | mms_id_vals.str.startswith(NOT_FOUND_MARKER)
+    orig_id_vals = _stripped(df['originating_system_id'])
+    has_orig_id = (orig_id_vals != '') & (orig_id_vals != 'nan')
+
+    needs_lookup = ~is_comment & is_empty_mms_id & has_orig_id
+    result.comment_count += int(is_comment.sum())
+    # Already has mms_id, or no originating_system_id to look up
+    result.skipped_count += int((~is_comment & ~needs_lookup).sum())
+
+    lookup_ids = orig_id_vals[needs_lookup]
+    unique_ids = lookup_ids.unique()
+    progress(f"Matching {len(unique_ids)} unique IDs for {len(lookup_ids)} rows...")
+    result.metrics.count('rows', len(df))
+    result.metrics.count('lookups', len(unique_ids))
+
+    # Find unique Network Numbers that contain each originating_system_id
+    # (duplicates in reference data are not counted as multiple matches)
+    resolved = {}
+    match_counts = {}
+    matched_network_numbers = {}
+    not_found_marker = f"{NOT_FOUND_MARKER} - {timestamp}"
+    cached = {}
+    if matcher.snapshot is None:
+        # Results can only be cached against a known reference version
+        match_cache = None
+    if match_cache is not None:
+        with result.metrics.span('match_cache'):
+            cached = match_cache.get_many(unique_ids, matcher.snapshot)
+    # The remaining IDs go to the matcher in batches: one request each for
+    # the lookup service, with progress (and cancelling) between batches
+    pending = [orig_id for orig_id in unique_ids if orig_id not in cached]
+    fresh = {}
+    with result.metrics.span('match'):
+        for start in range(0, len(pending), MATCH_BATCH_SIZE):
+            progress(f"Matched {start} of {len(pending)} unique IDs", start, len(pending))
+            fresh.update(matcher.match_many(pending[start:start + MATCH_BATCH_SIZE]))
+        for orig_id in unique_ids:
+            matches = cached.get(orig_id)
+            if matches is None:
+                matches = fresh[orig_id]
+            match_counts[orig_id] = len(matches)
+            if len(matches) == 1:
+                resolved[orig_id] = matches[0][1]
+            elif len(matches) > 1:
+                matched_network_numbers[orig_id] = [m[0] for m in matches]
+            else:
+                resolved[orig_id] = not_found_marker
+
+    if match_cache is not None:
+        with result.metrics.span('match_cache'):
+            match_cache.put_many(fresh, matcher.snapshot)
+        result.metrics.count('match_cache_hits', len(cached))
+        result.metrics.count('match_cache_misses', len(fresh))
+
+    row_match_counts = lookup_ids.map(match_counts)
+    result.updated_count += int((row_match_counts == 1).sum())
+    result.multiple_matches_count += int((row_match_counts > 1).sum())
+    result.not_found_count += int((row_match_counts == 0).sum())
+
+    # Write matched MMS Ids and NOT FOUND markers back in one assignment
+    new_values = lookup_ids.map(resolved)
+    new_values = new_values[new_values.notna()]
+    df.loc[new_values.index, 'mms_id'] = new_values.to_numpy()
+
+    # Per-row diagnostics for the rows that could not be resolved, queued
+    # for the row report in one batch rather than logged row by row
+    report_path = row_report_path()
+    report = []
+    for idx, orig_id in lookup_ids[row_match_counts != 1].items():
+        if report_path is not None:
+            report.append({
+                'file': str(result.csv_path), 'row': idx + 1, 'originating_system_id': orig_id,
+                'status': 'ambiguous' if orig_id in matched_network_numbers else 'not_found',
+                'network_numbers': matched_network_numbers.get(orig_id, []), 'timestamp': timestamp,
+            })
+        if orig_id in matched_network_numbers:
+            if len(result.multiple_match_samples) < 3:
+                match_details = f"'{orig_id}' found in: {matched_network_numbers[orig_id]}"
+                result.multiple_match_samples.append(match_details)
+            entry = result.ambiguous.get(orig_id)
+            if entry is None:
+                entry = result.ambiguous[orig_id] = {
+                    'rows': 0, 'row_numbers': [], 'network_numbers': matched_network_numbers[orig_id],
+                }
+            entry['rows'] += 1
+            if len(entry['row_numbers']) < REPORT_ROW_SAMPLE:
+                entry['row_numbers'].append(idx + 1)
+        else:
+            if len(result.not_found_samples) < 5:
+                result.not_found_samples.append(orig_id)
+    if report:
+        report_rows(report)
+        result.row_report_path = report_path
+
+
+def not_found_timestamp():
+    """Return the timestamp used in NOT FOUND IN ALMA markers"""
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _prepare_frame(df, result):
+    """Drop blank rows, check required columns and normalize 'nan' strings"""
+    # Remove completely blank rows
+    row_count = len(df)
+    df.dropna(how='all', inplace=True)
+    result.blank_rows_removed += row_count - len(df)
+
+    # Check for required columns
+    if 'originating_system_id' not in df.columns:
+        raise ValueError("'originating_system_id' column not found in CSV")
+
+    if 'mms_id' not in df.columns:
+        # Add mms_id column if it doesn't exist
+        df['mms_id'] = ''
+
+    # Replace 'nan' strings with empty strings (from reading with dtype=str)
+    df['originating_system_id'] = df['originating_system_id'].replace('nan', '')
+    df['mms_id'] = df['mms_id'].replace('nan', '')
+    return df
+
+
+def _log_reference_check(matcher, df):
+    """Log sample reference entries and a test search for the first ID"""
+    logger.info(f"Reference data loaded with {len(matcher)} entries")
+
+    # Log sample entries from reference for debugging
+    sample_entries = list(zip(matcher.network_numbers[:3], matcher.mms_ids[:3]))
+    logger.info(f"Sample reference entries (Network Number, MMS Id): {sample_entries}")
+
+    # Test search for the first originating_system_id to verify matching logic
+    if len(df) > 0:
+        test_id = str(df['originating_system_id'].iloc[0]).strip()
+        test_matches = [net_num for net_num, _ in matcher.match(test_id)]
+        logger.info(f"Test search for first ID '{test_id}': found {len(test_matches)} matches")
+        if test_matches:
+            logger.info(f"Test match example: '{test_matches[0]}'")
+
+
+def _write_ambiguity_report(result, output_path):
+    """Write the ambiguity report beside output_path, or remove one left by an earlier run"""
+    report_path = ambiguity_report_path(output_path)
+    if not result.ambiguous:
+        if report_path.exists():
+            report_path.unlink()
+        return
+    write_ambiguity_report(report_path, result.ambiguous)
+    result.ambiguity_report_path = report_path
+    logger.warning(f"{result.multiple_matches_count} rows with ambiguous IDs "
+                   f"({len(result.ambiguous)} distinct IDs) listed in: {report_path}")
+
+
+def _log_issue_samples(result):
+    """Log samples of issues for debugging"""
+    if result.not_found_samples:
+        logger.warning(f"Sample originating_system_id values not found in any Network Number: {result.not_found_samples}")
+    if result.multiple_match_samples:
+        logger.warning(f"Sample multiple match cases: {result.multiple_match_samples}")
+    if result.row_report_path is not None:
+        logger.info(f"Every not-found and ambiguous row is listed in: {result.row_report_path}")
+
+
+def read_input_csv(csv_path, **options):
+    """
+    Read an input CSV for process_file or, with chunksize in options, for
+    process_file_streaming.
+    """
+    # Read every column as text, so values are written back exactly as they
+    # were read (1742929948 does not become 1742929948.0) whichever path runs
+    return pd.read_csv(csv_path, dtype=str, **options)
+
+
+def process_file(csv_path, matcher, progress=None, timestamp=None, metrics=None, frame=None, match_cache=None,
+                 companion=None):
+    """
+    Update the mms_id column of one CSV file from the reference matcher and
+    save it next to the original with the UPDATED_ prefix.
+
+    progress, if given, is called as progress(message, done=None, total=None)
+    as work proceeds; it may raise to abandon the run.  timestamp is used for
+    NOT FOUND IN ALMA markers and defaults to the time the file is started.
+    Stage timings and counters are added to metrics (a new RunMetrics if not
+    given).  frame is the file already read with read_input_csv, if it was
+    prefetched.  match_cache, if given, is a MatchCache of earlier lookup
+    results.  companion, if given, is a CompanionIndex used to fill the
+    file_internal_path and deleted columns.  Returns a ProcessResult.
+    """
+    progress = progress or _no_progress
+    timestamp = timestamp or not_found_timestamp()
+    result = ProcessResult(csv_path, metrics)
+
+    if frame is None:
+        # Load the selected CSV
+        progress("Loading selected CSV file...")
+        logger.info("Loading selected CSV file...")
+        with result.metrics.span('read_input'):
+            frame = read_input_csv(csv_path)
+    df = frame
+    logger.info(f"Selected CSV loaded: {len(df)} rows")
+
+    with result.metrics.span('prepare'):
+        df = _prepare_frame(df, result)
+    if result.blank_rows_removed > 0:
+        logger.info(f"Removed {result.blank_rows_removed} blank rows from CSV")
+    logger.info(f"Processing {len(df)} non-blank rows")
+
+    progress(f"Reference data loaded with {len(matcher)} entries")
+    _log_reference_check(matcher, df)
+
+    # Classify and update all rows at once
+    logger.info(f"Processing {len(df)} rows...")
+    update_mms_ids(df, matcher, result, timestamp, progress, match_cache)
+    _log_issue_samples(result)
+    if companion is not None:
+        with result.metrics.span('companion_columns'):
+            companion.fill_columns(df)
+
+    # Save updated CSV
+    progress("Saving updated CSV...")
+    logger.info("Saving updated CSV...")
+
+    with result.metrics.span('write_output'):
+        # Blank rows were already dropped in place by _prepare_frame and
+        # matching only fills cells, so the frame is written as it stands.
+        # The UPDATED_ file only appears once it is complete.
+        new_path = updated_output_path(csv_path)
+        result.metrics.count('output_bytes', write_csv(df, new_path))
+    result.output_path = new_path
+    _write_ambiguity_report(result, new_path)
+
+    logger.info(f"CSV saved as: {new_path}")
+    result.log_summary()
+    return result
+
+
+def process_file_streaming(csv_path, matcher, progress=None, timestamp=None, chunksize=DEFAULT_CHUNKSIZE,
+                           metrics=None, checkpoint=False, match_cache=None, companion=None):
+    """
+    Streaming variant of process_file for very large inputs.
+
+    The CSV is read chunksize rows at a time, each chunk is resolved against
+    the reference matcher and appended to UPDATED_<name>.csv.partial straight
+    away, so memory stays bounded; the finished file is renamed to the
+    UPDATED_ name, so an interrupted run never leaves a truncated UPDATED_ file.
+    Every column is read as text so values are written back exactly as read,
+    independent of how rows fall into chunks.
+
+    With checkpoint=True progress is recorded after every chunk in a
+    .checkpoint file next to the partial output, and a run that finds a
+    checkpoint for the same input, reference and extra columns resumes
+    after the last completed chunk, reusing the interrupted run's NOT FOUND
+    IN ALMA timestamp.  The checkpoint is removed when the file is complete.
+    match_cache and companion are used as in process_file.
+    """
+    progress = progress or _no_progress
+    timestamp = timestamp or not_found_timestamp()
+    result = ProcessResult(csv_path, metrics)
+    new_path = updated_output_path(csv_path)
+    work_path = partial_path(new_path)
+
+    tracker = None
+    if checkpoint:
+        tracker = StreamCheckpoint(csv_path, work_path, chunksize, matcher.snapshot,
+                                   extra_columns=companion is not None)
+    state = tracker.load() if tracker else None
+    chunks_done = 0
+    rows_read = 0
+    header_written = False
+    resumed_bytes = 0
+    if state is not None:
+        timestamp = state['timestamp']
+        result.restore(state['result'])
+        chunks_done = state['chunks_done']
+        rows_read = state['rows_read']
+        header_written = True
+        resumed_bytes = state['output_bytes']
+        # Drop anything written after the last checkpoint; it is redone below
+        with open(work_path, 'r+b') as output:
+            output.truncate(resumed_bytes)
+        logger.info(f"Resuming {csv_path} after {rows_read} rows from checkpoint {tracker.path}")
+        progress(f"Resuming after {rows_read} rows...")
+
+    logger.info(f"Streaming {csv_path} in chunks of {chunksize} rows...")
+    with open_output(work_path, 'ab' if state else 'wb') as output:
+        chunks = iter(read_input_csv(csv_path, chunksize=chunksize))
+        # Completed chunks are parsed again but not matched or written.
+        # skiprows cannot be used to jump ahead because it counts blank
+        # lines, which chunks do not.
+        for _ in range(chunks_done):
+            with result.metrics.span('read_input'):
+                next(chunks, None)
+        while True:
+            with result.metrics.span('read_input'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            rows_read += len(chunk)
+            with result.metrics.span('prepare'):
+                chunk = _prepare_frame(chunk, result)
+            if not header_written:
+                _log_reference_check(matcher, chunk)
+
+            update_mms_ids(chunk, matcher, result, timestamp, match_cache=match_cache)
+            if companion is not None:
+                with result.metrics.span('companion_columns'):
+                    companion.fill_columns(chunk)
+            with result.metrics.span('write_output'):
+                write_frame(chunk, output, header=not header_written)
+                # Hand each chunk to the OS so the partial file keeps up with the run
+                output.flush()
+            header_written = True
+            chunks_done += 1
+            if tracker:
+                with result.metrics.span('checkpoint'):
+                    tracker.save(output, chunks_done, rows_read, timestamp, result)
+            progress(f"Processed {rows_read} rows", rows_read)
+
+        if not header_written:
+            # Header-only input still produces a header-only output
+            empty = _prepare_frame(read_input_csv(csv_path, nrows=0), result)
+            if companion is not None:
+                companion.fill_columns(empty)
+            write_frame(empty, output)
+        with result.metrics.span('write_output'):
+            finish_output(output)
+        result.metrics.count('output_bytes', output.tell() - resumed_bytes)
+    os.replace(work_path, new_path)
+    _write_ambiguity_report(result, new_path)
+
+    if tracker:
+        tracker.clear()
+    _log_issue_samples(result)
+    if result.blank_rows_removed > 0:
+        logger.info(f"Removed {result.blank_rows_removed} blank rows from CSV")
+    result.output_path = new_path
+    logger.info(f"CSV saved as: {new_path}")
+    result.log_summary()
+    return result
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Instrumentation - named timing spans, counters and an opt-in profiler for
+finding out which pipeline stage makes a run slow.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+
+logger = logging.getLogger(__name__)
+
+# Set ALMA_PROFILE=1 to run cProfile around each run
+PROFILE_ENV_VAR = "ALMA_PROFILE"
+# Throughputs reported in summaries: name -> (counter, span)
+RATES = {
+    'output_bytes_per_s': ('output_bytes', 'write_output'),
+}
+
+
+class RunMetrics:
+    """Accumulated stage timings (seconds) and counters for one run"""
+
+    def __init__(self):
+        self.spans = {}
+        self.counters = Counter()
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block, adding to any earlier time under the same name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def merge(self, other):
+        """Add another run's spans and counters to this one"""
+        for name, seconds in other.spans.items():
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+        self.counters.update(other.counters)
+
+    def rate(self, counter, span):
+        """Return the counter per second spent in span, or None if either is missing"""
+        seconds = self.spans.get(span)
+        if not seconds or counter not in self.counters:
+            return None
+        return self.counters[counter] / seconds
+
+    def rates(self):
+        return {name: round(self.rate(*source), 1) for name, source in RATES.items()
+                if self.rate(*source) is not None}
+
+    def summary(self, **fields):
+        """Return the metrics as a JSON-serializable dict"""
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            **fields,
+            'spans': {name: round(seconds, 4) for name, seconds in self.spans.items()},
+            'counters': dict(self.counters),
+            'rates': self.rates(),
+        }
+
+    def timing_message(self):
+        """Return a one-line stage timing summary for the results panel"""
+        if not self.spans:
+            return ""
+        parts = [f"{name} {seconds:.2f}s" for name, seconds in self.spans.items()]
+        output_rate = self.rate('output_bytes', 'write_output')
+        if output_rate is not None:
+            parts.append(f"output written at {output_rate / (1024 * 1024):.1f} MB/s")
+        return "Timings: " + ", ".join(parts)
+
+    def log_summary(self, jsonl_path=None, **fields):
+        """Log the structured summary and append it as a JSON line to jsonl_path"""
+        line = json.dumps(self.summary(**fields))
+        logger.info(f"Run metrics: {line}")
+        if jsonl_path is not None:
+            with open(jsonl_path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+
+def profile_enabled():
+    return os.environ.get(PROFILE_ENV_VAR, "").strip().lower() in ("1", "true", "yes")
+
+
+@contextmanager
+def profiled(output_path, enabled=True):
+    """Run the enclosed block under cProfile and save the stats to output_path"""
+    if not enabled:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(str(output_path))
+        logger.info(f"Profile saved to: {output_path} (view with: python -m pstats {output_path})")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Log queue - moves log output off the processing threads.  Records are put
+on a queue and written to the log file, the console and the per-row report
+by one background thread, so a file with thousands of unresolved rows never
+waits on the disk or the terminal.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from multiprocessing import util as multiprocessing_util
+
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Logger whose records carry a batch of per-row diagnostics for the row report
+ROW_REPORT_LOGGER = "alma_csv_updater.rows"
+
+row_logger = logging.getLogger(ROW_REPORT_LOGGER)
+row_logger.propagate = False
+
+# The queue handler installed on the root and row loggers, and the thread
+# draining it; None until start_logging is called
+_queue_handler = None
+_listener = None
+_row_report_path = None
+
+
+def _is_row_report(record):
+    return record.name == ROW_REPORT_LOGGER
+
+
+def _is_log_line(record):
+    return record.name != ROW_REPORT_LOGGER
+
+
+class RowReportHandler(logging.FileHandler):
+    """Appends the rows of each row report record as JSON lines"""
+
+    def format(self, record):
+        return "\n".join(json.dumps(row, ensure_ascii=False) for row in record.rows)
+
+
+def _start_listener(handlers):
+    global _listener
+    _queue_handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Worker processes leave through multiprocessing's exit path, which skips atexit
+    multiprocessing_util.Finalize(None, stop_logging, exitpriority=0)
+
+
+def start_logging(log_file, row_report_path=None, console=True):
+    """
+    Send log records to log_file (and the console) and per-row diagnostics
+    to row_report_path through a background writer thread.  Both files are
+    appended to.  Does nothing if logging was already started.
+    """
+    global _queue_handler, _row_report_path
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(log_file)]
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(_is_log_line)
+    if row_report_path is not None:
+        row_handler = RowReportHandler(row_report_path, encoding='utf-8', delay=True)
+        row_handler.addFilter(_is_row_report)
+        handlers.append(row_handler)
+        row_logger.setLevel(logging.INFO)
+        _row_report_path = row_report_path
+
+    _queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(_queue_handler)
+    if row_report_path is not None:
+        row_logger.addHandler(_queue_handler)
+    _start_listener(handlers)
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write out every queued record and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+def _restart_in_child():
+    # A forked child inherits the queue but not the thread draining it
+    global _listener
+    if _listener is not None:
+        handlers = _listener.handlers
+        _listener = None
+        _start_listener(handlers)
+
+
+os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def logging_config():
+    """Return the arguments for start_logging in a spawned worker, or None if logging was not started"""
+    if _listener is None:
+        return None
+    log_file = next(handler.baseFilename for handler in _listener.handlers
+                    if not isinstance(handler, RowReportHandler))
+    return log_file, _row_report_path
+
+
+def row_report_path():
+    """Return the per-row report file, or None when rows are not being reported"""
+    return _row_report_path if row_logger.handlers else None
+
+
+def report_rows(rows):
+    """Queue a list of per-row diagnostic dicts for the row report"""
+    if rows and row_logger.handlers:
+        row_logger.info("%d row diagnostics", len(rows), extra={'rows': rows})
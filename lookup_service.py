@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Lookup service - keeps one warm reference index in a long-running local
+HTTP server so several app instances (or scripts) can share it instead of
+each loading and indexing the reference CSV.
+
+    python lookup_service.py --port 8765
+
+Endpoints:
+    GET  /health    {"status": "ok", "entries": N, "reference": path, "sample": [[net, mms], ...]}
+    POST /lookup    {"ids": ["grinnell:123", ...]} -> {"results": [{"id", "status", "mms_id", "matches"}, ...]}
+    POST /process   a CSV body -> the updated CSV, with the run counters as JSON in X-Alma-Counts
+
+Point the app at it with ALMA_LOOKUP_SERVICE=http://127.0.0.1:8765.
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import socket
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from core import DEFAULT_REFERENCE_CSV_PATH, load_reference, process_file, resolve_reference_path, setup_logging
+from reference_cache import ReferenceCache
+from reference_watch import ReferenceWatcher
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Environment variable the app reads to use a service instead of a local index
+SERVICE_ENV_VAR = "ALMA_LOOKUP_SERVICE"
+# Largest request body accepted (a whole input CSV for /process)
+MAX_BODY_BYTES = 512 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def lookup_result(query, matches):
+    """Describe the matches for one ID the way /lookup reports them"""
+    if len(matches) == 1:
+        status, mms_id = "matched", matches[0][1]
+    elif matches:
+        status, mms_id = "ambiguous", None
+    else:
+        status, mms_id = "not_found", None
+    return {
+        'id': query,
+        'status': status,
+        'mms_id': mms_id,
+        'matches': [[net_num, match_mms_id] for net_num, match_mms_id in matches],
+    }
+
+
+class LookupRequestHandler(BaseHTTPRequestHandler):
+    """Request handler; the server carries the reference watcher holding the current index"""
+
+    # Keep-alive, so a client can send many lookups over one connection;
+    # without TCP_NODELAY each small response waits on a delayed ACK
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    @property
+    def matcher(self):
+        return self.server.watcher.matcher
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} - {format % args}")
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send(status, {'error': message})
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            # The unread body would be taken for the next request
+            self.close_connection = True
+            raise ValueError(f"Request body too large ({length} bytes)")
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/health":
+            self._send_error(404, f"Unknown endpoint: {self.path}")
+            return
+        matcher = self.matcher
+        self._send(200, {
+            'status': "ok",
+            'entries': len(matcher),
+            'reference': str(self.server.watcher.csv_path),
+            'sample': [list(pair) for pair in zip(matcher.network_numbers[:3], matcher.mms_ids[:3])],
+        })
+
+    def do_POST(self):
+        endpoint = urlsplit(self.path).path
+        try:
+            body = self._read_body()
+            if endpoint == "/lookup":
+                self._lookup(body)
+            elif endpoint == "/process":
+                self._process(body)
+            else:
+                self._send_error(404, f"Unknown endpoint: {self.path}")
+        except ValueError as e:
+            self._send_error(400, str(e))
+        except Exception as e:
+            logger.exception(f"Error handling {endpoint}")
+            self._send_error(500, str(e))
+
+    def _lookup(self, body):
+        try:
+            ids = json.loads(body)['ids']
+        except (ValueError, KeyError, TypeError):
+            raise ValueError('Expected a JSON body like {"ids": ["grinnell:123", ...]}')
+        if not isinstance(ids, list) or not all(isinstance(query, str) for query in ids):
+            raise ValueError("'ids' must be a list of strings")
+        # One matcher for the whole request, even if a reload lands meanwhile
+        matcher = self.matcher
+        matches = matcher.match_many(ids)
+        self._send(200, {'results': [lookup_result(query, matches[query]) for query in ids]})
+
+    def _process(self, body):
+        name = Path(self.headers.get("X-Filename") or "input.csv").name.replace('"', "") or "input.csv"
+        with tempfile.TemporaryDirectory(prefix="alma_service_") as work_dir:
+            csv_path = Path(work_dir) / name
+            csv_path.write_bytes(body)
+            result = process_file(csv_path, self.matcher)
+            updated = result.output_path.read_bytes()
+        self._send(200, updated, content_type="text/csv; charset=utf-8", headers={
+            'Content-Disposition': f'attachment; filename="{result.output_path.name}"',
+            'X-Alma-Counts': json.dumps(result.counts()),
+        })
+
+
+class LookupServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, watcher):
+        self.watcher = watcher
+        super().__init__(address, LookupRequestHandler)
+
+
+class RemoteMatcher:
+    """
+    Client for a running lookup service with the parts of the
+    ReferenceMatcher interface that core.process_file uses.
+
+    Each match() or match_many() is one request over a kept-alive connection.
+    network_numbers and mms_ids hold only the service's sample entries.
+    """
+
+    # The version of the service's reference is not known to the client
+    snapshot = None
+
+    def __init__(self, url, timeout=30):
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname or DEFAULT_HOST
+        self.port = parts.port or DEFAULT_PORT
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._connection = None
+        health = self._request("GET", "/health")
+        self.entry_count = health['entries']
+        self.reference = health['reference']
+        self.network_numbers = [net_num for net_num, _ in health['sample']]
+        self.mms_ids = [mms_id for _, mms_id in health['sample']]
+
+    def __len__(self):
+        return self.entry_count
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        with self._lock:
+            for attempt in range(2):
+                if self._connection is None:
+                    self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                    self._connection.connect()
+                    # Headers and body go out as separate writes; don't let Nagle hold the body back
+                    self._connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                try:
+                    self._connection.request(method, path, body=body, headers=headers)
+                    response = self._connection.getresponse()
+                    data = response.read()
+                    break
+                except (http.client.HTTPException, ConnectionError):
+                    # The service closed an idle connection; reconnect once
+                    self._connection.close()
+                    self._connection = None
+                    if attempt:
+                        raise
+        if response.status != 200:
+            try:
+                message = json.loads(data)['error']
+            except Exception:
+                message = data.decode('utf-8', 'replace')
+            raise RuntimeError(f"Lookup service error {response.status}: {message}")
+        return json.loads(data)
+
+    def lookup(self, queries):
+        """Return the /lookup results for a list of IDs"""
+        return self._request("POST", "/lookup", {'ids': list(queries)})['results']
+
+    def match(self, query):
+        """Return [(Network Number, MMS Id)] for every Network Number containing query"""
+        return [tuple(match) for match in self.lookup([query])[0]['matches']]
+
+    def match_many(self, queries):
+        """Return {query: match(query)} for a batch of queries, in one request"""
+        queries = list(queries)
+        if not queries:
+            return {}
+        return {result['id']: [tuple(match) for match in result['matches']] for result in self.lookup(queries)}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serve reference lookups over HTTP on this machine.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on (default: %(default)s)")
+    parser.add_argument("--reference", default=DEFAULT_REFERENCE_CSV_PATH,
+                        help="Reference CSV path (default: %(default)s)")
+    parser.add_argument("--cache-dir", default="cache",
+                        help="Directory for the compiled reference cache (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    log_file = setup_logging()
+    logger.info("=" * 60)
+    logger.info("Alma lookup service starting")
+    logger.info(f"Log file: {log_file}")
+    logger.info("=" * 60)
+
+    try:
+        reference_path, fallback_warning = resolve_reference_path(args.reference)
+        if fallback_warning:
+            logger.warning("Using local copy for processing.")
+        cache = ReferenceCache(args.cache_dir, mapped=True)
+        matcher, _ = load_reference(reference_path, cache)
+    except Exception as e:
+        logger.error(f"Error loading reference CSV: {str(e)}")
+        return 2
+
+    # Reloads swap watcher.matcher, which every request reads
+    watcher = ReferenceWatcher(reference_path, matcher, cache=cache)
+    watcher.start()
+    server = LookupServer((args.host, args.port), watcher)
+    logger.info(f"Serving {len(matcher)} reference entries on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Lookup service stopped")
+    finally:
+        watcher.stop()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
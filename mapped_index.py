@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Mapped index - a compact binary export of the reference lookup index that is
+queried through mmap, so opening it costs almost nothing and every process
+on the machine shares one copy of it in the page cache.
+"""
+
+import json
+import mmap
+import re
+import struct
+
+import numpy as np
+
+from matcher import ReferenceMatcher
+
+
+MAGIC = b"ALMAIDX1"
+# Bump whenever the section layout changes
+FORMAT_VERSION = 1
+
+# Separates tokens and Network Numbers in their blobs
+_SEPARATOR = b"\x00"
+_MMS_ID_PATTERN = re.compile(r"[1-9][0-9]{0,17}")
+_ALIGNMENT = 8
+
+
+def _byte_trigram_keys(blob, offsets):
+    """Return (keys, owners): every byte trigram inside an item of blob as a 24-bit int, with the item's id"""
+    data = np.frombuffer(blob, dtype=np.uint8).astype(np.uint32)
+    if len(data) < 3:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+    keys = (data[:-2] << 16) | (data[1:-1] << 8) | data[2:]
+    # Items contain no separator bytes, so a trigram without one lies inside a single item
+    positions = np.flatnonzero((data[:-2] != 0) & (data[1:-1] != 0) & (data[2:] != 0))
+    owners = np.searchsorted(offsets, positions, side='right') - 1
+    return keys[positions], owners.astype(np.uint32)
+
+
+def _blob(items):
+    """Join byte strings with the separator; return (blob, offsets) where item i is blob[offsets[i]:offsets[i+1]-1]"""
+    blob = _SEPARATOR.join(items) + _SEPARATOR
+    lengths = np.fromiter((len(item) + 1 for item in items), dtype=np.uint64, count=len(items))
+    offsets = np.zeros(len(items) + 1, dtype=np.uint64)
+    np.cumsum(lengths, out=offsets[1:])
+    return blob, offsets
+
+
+def _postings(keys, values):
+    """Group values by key; return (unique keys, offsets, values) with values ascending within each key"""
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    if len(keys):
+        distinct = np.concatenate(([True], (keys[1:] != keys[:-1]) | (values[1:] != values[:-1])))
+        keys, values = keys[distinct], values[distinct]
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    offsets = np.zeros(len(unique_keys) + 1, dtype=np.uint64)
+    np.cumsum(counts, out=offsets[1:])
+    return unique_keys, offsets, values.astype(np.uint32)
+
+
+def write_mapped_index(matcher, f, metadata=None):
+    """
+    Write matcher to the binary file object f.
+
+    MMS Ids are stored as 64-bit integers, so a reference whose MMS Ids are
+    not plain decimal numbers raises ValueError; use the pickled matcher for
+    those.
+    """
+    network_numbers = []
+    mms_ids = []
+    for net_num, mms_id in zip(matcher.network_numbers, matcher.mms_ids):
+        if net_num is None:
+            continue
+        if not _MMS_ID_PATTERN.fullmatch(mms_id):
+            raise ValueError(f"MMS Id {mms_id!r} cannot be stored as an integer")
+        network_numbers.append(net_num.encode('utf-8'))
+        mms_ids.append(int(mms_id))
+    if any(_SEPARATOR in net_num for net_num in network_numbers):
+        raise ValueError("Network Number contains a NUL character")
+
+    net_blob, net_offsets = _blob(network_numbers)
+
+    # Token table, sorted by its UTF-8 bytes so exact lookups can bisect it
+    token_nets = {}
+    for net_id, net_num in enumerate(network_numbers):
+        for token in ReferenceMatcher._tokenize(net_num.decode('utf-8')):
+            postings = token_nets.setdefault(token.encode('utf-8'), [])
+            if not postings or postings[-1] != net_id:
+                postings.append(net_id)
+    tokens = sorted(token_nets)
+    token_blob, token_offsets = _blob(tokens)
+    token_post_offsets = np.zeros(len(tokens) + 1, dtype=np.uint64)
+    np.cumsum([len(token_nets[token]) for token in tokens], out=token_post_offsets[1:])
+    token_postings = np.fromiter((net_id for token in tokens for net_id in token_nets[token]),
+                                 dtype=np.uint32, count=int(token_post_offsets[-1]))
+
+    # Byte trigram -> token ids.  UTF-8 is self-synchronizing, so a byte
+    # substring test gives the same answer as the str test.
+    gram_keys, gram_tokens = _byte_trigram_keys(token_blob, token_offsets)
+    gram_keys, gram_offsets, gram_postings = _postings(gram_keys, gram_tokens)
+
+    sections = [
+        ('net_blob', np.frombuffer(net_blob, dtype=np.uint8)),
+        ('net_offsets', net_offsets),
+        ('mms_ids', np.array(mms_ids, dtype=np.int64)),
+        ('token_blob', np.frombuffer(token_blob, dtype=np.uint8)),
+        ('token_offsets', token_offsets),
+        ('token_post_offsets', token_post_offsets),
+        ('token_postings', token_postings),
+        ('gram_keys', gram_keys.astype(np.uint32)),
+        ('gram_offsets', gram_offsets),
+        ('gram_postings', gram_postings),
+    ]
+    header = {
+        'version': FORMAT_VERSION,
+        'metadata': metadata or {},
+        'entry_count': len(matcher),
+        'sections': {},
+    }
+    # Lay the sections out after the header, each 8-byte aligned
+    header_size = 4096
+    while True:
+        offset = header_size
+        for name, data in sections:
+            header['sections'][name] = {'offset': offset, 'dtype': data.dtype.str, 'count': len(data)}
+            offset += -(-data.nbytes // _ALIGNMENT) * _ALIGNMENT
+        header_bytes = json.dumps(header).encode('utf-8')
+        if len(MAGIC) + 4 + len(header_bytes) <= header_size:
+            break
+        header_size *= 2
+
+    f.write(MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+    f.write(b"\0" * (header_size - len(MAGIC) - 4 - len(header_bytes)))
+    for name, data in sections:
+        f.write(data.tobytes())
+        f.write(b"\0" * (-data.nbytes % _ALIGNMENT))
+
+
+def read_mapped_header(f):
+    """Return the header of a mapped index file without mapping it"""
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a mapped reference index")
+    (header_length,) = struct.unpack('<I', f.read(4))
+    return json.loads(f.read(header_length))
+
+
+class _MappedSequence:
+    """Read-only list-like view that decodes items from the mapping on access"""
+
+    def __init__(self, length, getter):
+        self.length = length
+        self.getter = getter
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.getter(i) for i in range(*key.indices(self.length))]
+        return self.getter(key)
+
+    def __iter__(self):
+        return (self.getter(i) for i in range(self.length))
+
+
+class MappedReferenceIndex:
+    """
+    A ReferenceMatcher stand-in backed by an mmap of a file written by
+    write_mapped_index.
+
+    Layout: Network Numbers and tokens are NUL-separated blobs with uint64
+    offset arrays; MMS Ids are an int64 array; token -> Network Number and
+    byte trigram -> token postings are uint32 arrays with offsets.  The
+    arrays are numpy views straight onto the mapping, so nothing is copied
+    into the process.  Matches are identical to the ReferenceMatcher the
+    file was written from.
+    """
+
+    NGRAM = 3
+    # Set by ReferenceCache, as for ReferenceMatcher
+    snapshot = None
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self.header = read_mapped_header(f)
+            if self.header.get('version') != FORMAT_VERSION:
+                raise ValueError(f"Unsupported mapped index version: {self.header.get('version')}")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        sections = {
+            name: np.frombuffer(self._mmap, dtype=np.dtype(spec['dtype']), count=spec['count'], offset=spec['offset'])
+            for name, spec in self.header['sections'].items()
+        }
+        self.net_offsets = sections['net_offsets']
+        self.mms_id_values = sections['mms_ids']
+        self.token_offsets = sections['token_offsets']
+        self.token_post_offsets = sections['token_post_offsets']
+        self.token_postings = sections['token_postings']
+        self.gram_keys = sections['gram_keys']
+        self.gram_offsets = sections['gram_offsets']
+        self.gram_postings = sections['gram_postings']
+        self._net_blob_start = self.header['sections']['net_blob']['offset']
+        self._net_blob_end = self._net_blob_start + int(self.net_offsets[-1])
+        self._token_blob_start = self.header['sections']['token_blob']['offset']
+        self._token_blob_end = self._token_blob_start + int(self.token_offsets[-1])
+        self.entry_count = self.header['entry_count']
+        self.network_numbers = _MappedSequence(len(self.mms_id_values), self._network_number)
+        self.mms_ids = _MappedSequence(len(self.mms_id_values), self._mms_id)
+
+    @property
+    def metadata(self):
+        return self.header['metadata']
+
+    # Pickle as the path so worker processes map the same file; the
+    # fingerprint catches a cache file replaced in the meantime, which would
+    # otherwise be matched under the parent's snapshot
+    def __getstate__(self):
+        return {'path': self.path, 'snapshot': self.snapshot, 'fingerprint': self.metadata.get('fingerprint')}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+        if self.metadata.get('fingerprint') != state['fingerprint']:
+            raise ValueError(f"Mapped index {self.path} was replaced by another reference version "
+                             "since it was loaded")
+        self.snapshot = state['snapshot']
+
+    def __len__(self):
+        return self.entry_count
+
+    def _network_number(self, net_id):
+        start = self._net_blob_start + int(self.net_offsets[net_id])
+        end = self._net_blob_start + int(self.net_offsets[net_id + 1]) - 1
+        return self._mmap[start:end].decode('utf-8')
+
+    def _mms_id(self, net_id):
+        return str(self.mms_id_values[net_id])
+
+    def _token(self, token_id):
+        start = self._token_blob_start + int(self.token_offsets[token_id])
+        end = self._token_blob_start + int(self.token_offsets[token_id + 1]) - 1
+        return self._mmap[start:end]
+
+    def _token_nets(self, token_id):
+        return self.token_postings[self.token_post_offsets[token_id]:self.token_post_offsets[token_id + 1]]
+
+    def _find_token(self, query):
+        """Return the id of the token equal to query (bytes), or None"""
+        low, high = 0, len(self.token_offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self._token(middle) < query:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.token_offsets) - 1 and self._token(low) == query:
+            return low
+        return None
+
+    def _find_in_blob(self, query, blob_start, blob_end, offsets):
+        """Yield ids of the blob items containing query, using mmap.find over the blob"""
+        position = self._mmap.find(query, blob_start, blob_end)
+        while position != -1:
+            # Match the array's dtype, or numpy converts the whole array per call
+            item_id = int(np.searchsorted(offsets, np.uint64(position - blob_start), side='right')) - 1
+            yield item_id
+            # Continue after the end of this item
+            position = self._mmap.find(query, blob_start + int(offsets[item_id + 1]), blob_end)
+
+    def _candidate_tokens(self, query):
+        """Return ids of tokens that may contain query, using the trigram postings"""
+        keys = {(query[i] << 16) | (query[i + 1] << 8) | query[i + 2] for i in range(len(query) - 2)}
+        postings = []
+        for key in keys:
+            gram_id = int(np.searchsorted(self.gram_keys, np.uint32(key)))
+            if gram_id == len(self.gram_keys) or self.gram_keys[gram_id] != key:
+                return ()
+            postings.append(self.gram_postings[self.gram_offsets[gram_id]:self.gram_offsets[gram_id + 1]])
+        postings.sort(key=len)
+        candidates = postings[0]
+        for token_ids in postings[1:]:
+            if len(candidates) <= 32:
+                break
+            candidates = np.intersect1d(candidates, token_ids, assume_unique=True)
+        return candidates.tolist()
+
+    def match_ids(self, query):
+        """Return sorted ids of Network Numbers that contain query"""
+        encoded = query.encode('utf-8')
+        if not query:
+            return list(range(len(self.mms_id_values)))
+        # As in ReferenceMatcher, IDs that can span tokens are searched for in
+        # the full Network Numbers
+        if ';' in query or query != query.strip() or _SEPARATOR in encoded:
+            return list(self._find_in_blob(encoded, self._net_blob_start, self._net_blob_end, self.net_offsets))
+
+        net_ids = set()
+        token_id = self._find_token(encoded)
+        if token_id is not None:
+            net_ids.update(self._token_nets(token_id).tolist())
+        if len(encoded) < self.NGRAM:
+            token_ids = self._find_in_blob(encoded, self._token_blob_start, self._token_blob_end, self.token_offsets)
+        else:
+            token_ids = self._candidate_tokens(encoded)
+        for candidate in token_ids:
+            if candidate == token_id:
+                continue
+            if encoded in self._token(candidate):
+                net_ids.update(self._token_nets(candidate).tolist())
+        return sorted(net_ids)
+
+    def match(self, query):
+        """Return [(Network Number, MMS Id)] for every Network Number containing query"""
+        return [(self._network_number(net_id), self._mms_id(net_id)) for net_id in self.match_ids(query)]
+
+    def match_many(self, queries):
+        """Return {query: match(query)} for a batch of queries"""
+        return {query: self.match(query) for query in queries}
+
+    def all_network_numbers(self):
+        """Return every Network Number in the mapping, decoded in one pass"""
+        blob = self._mmap[self._net_blob_start:self._net_blob_end].decode('utf-8')
+        return blob.split(_SEPARATOR.decode('ascii'))[:-1]
+
+    def updated(self, pairs, patch_limit=0.2):
+        """
+        Return (matcher, patched) for a new version of the reference pairs.
+        The mapping is read-only, so small changes are layered on top of it
+        as a PatchedMappedIndex; larger ones rebuild a ReferenceMatcher.
+        """
+        return PatchedMappedIndex.build(self, pairs, patch_limit)
+
+
+class PatchedMappedIndex:
+    """
+    A MappedReferenceIndex with the changes of a newer reference layered on
+    top: Network Numbers no longer in the reference are hidden, changed MMS
+    Ids are overridden, and added Network Numbers are indexed in a small
+    ReferenceMatcher whose ids follow the mapping's.  As with a patched
+    ReferenceMatcher, added Network Numbers come after the mapped ones in
+    ambiguous match lists.
+    """
+
+    snapshot = None
+
+    def __init__(self, base, removed, mms_overrides, added, entry_count):
+        self.base = base
+        self.removed = removed
+        self.mms_overrides = mms_overrides
+        self.added = added
+        self.entry_count = entry_count
+        self._base_count = len(base.mms_ids)
+        length = self._base_count + len(added.network_numbers)
+        self.network_numbers = _MappedSequence(length, self._network_number)
+        self.mms_ids = _MappedSequence(length, self._mms_id)
+
+    @classmethod
+    def build(cls, base, pairs, patch_limit=0.2):
+        """Return (matcher, patched) for pairs, patching base unless too much changed"""
+        pairs = list(pairs)
+        first_mms_ids = {}
+        for net_num, mms_id in pairs:
+            first_mms_ids.setdefault(net_num, mms_id)
+
+        base_ids = {net_num: net_id for net_id, net_num in enumerate(base.all_network_numbers())}
+        added = [(net_num, mms_id) for net_num, mms_id in first_mms_ids.items() if net_num not in base_ids]
+        removed = {net_id for net_num, net_id in base_ids.items() if net_num not in first_mms_ids}
+        if len(added) + len(removed) > patch_limit * max(len(base_ids), 1):
+            return ReferenceMatcher(pairs), False
+
+        base_mms_ids = base.mms_id_values.tolist()
+        mms_overrides = {}
+        for net_num, net_id in base_ids.items():
+            mms_id = first_mms_ids.get(net_num)
+            if mms_id is not None and mms_id != str(base_mms_ids[net_id]):
+                mms_overrides[net_id] = mms_id
+        return cls(base, removed, mms_overrides, ReferenceMatcher(added), len(pairs)), True
+
+    def __len__(self):
+        return self.entry_count
+
+    def _network_number(self, net_id):
+        if net_id >= self._base_count:
+            return self.added.network_numbers[net_id - self._base_count]
+        if net_id in self.removed:
+            return None
+        return self.base.network_numbers[net_id]
+
+    def _mms_id(self, net_id):
+        if net_id >= self._base_count:
+            return self.added.mms_ids[net_id - self._base_count]
+        if net_id in self.removed:
+            return None
+        return self.mms_overrides.get(net_id) or self.base.mms_ids[net_id]
+
+    def match_ids(self, query):
+        """Return sorted ids of Network Numbers that contain query"""
+        net_ids = [net_id for net_id in self.base.match_ids(query) if net_id not in self.removed]
+        return net_ids + [self._base_count + net_id for net_id in self.added.match_ids(query)]
+
+    def match(self, query):
+        """Return [(Network Number, MMS Id)] for every Network Number containing query"""
+        return [(self._network_number(net_id), self._mms_id(net_id)) for net_id in self.match_ids(query)]
+
+    def match_many(self, queries):
+        """Return {query: match(query)} for a batch of queries"""
+        return {query: self.match(query) for query in queries}
+
+    def updated(self, pairs, patch_limit=0.2):
+        """Return (matcher, patched) for a newer reference, patching the same mapping"""
+        return PatchedMappedIndex.build(self.base, pairs, patch_limit)
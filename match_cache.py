@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Match cache - remembers what each originating_system_id resolved to in
+earlier runs, so IDs that come back batch after batch are answered from a
+local SQLite file instead of the reference index.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+# Bump whenever the stored result format changes
+MATCH_CACHE_VERSION = 2
+DEFAULT_MAX_ENTRIES = 500000
+# File name of the match cache inside the reference cache directory
+MATCH_CACHE_NAME = "matches.sqlite3"
+
+# SQLite limits the number of parameters in one statement
+_BATCH_SIZE = 500
+
+
+def reference_snapshot(fingerprint):
+    """Return a short id for one version of the reference file, from its file_fingerprint"""
+    encoded = json.dumps(fingerprint, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+class MatchCache:
+    """
+    Persistent originating_system_id -> match list cache.
+
+    The stored value is the full list of (Network Number, MMS Id) matches,
+    so unique, ambiguous and not-found outcomes are all remembered.  Every
+    result is stored under the reference snapshot of the matcher that
+    produced it and is only returned for that snapshot, so a process or run
+    still using an older reference can never hand its results to one using
+    a newer reference.  Results of other snapshots than the current one are
+    dropped when the cache is opened or set_snapshot is called.  When it
+    grows past max_entries the least recently used IDs are dropped.
+    """
+
+    def __init__(self, path, snapshot, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.snapshot = snapshot
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._connection = None
+
+    # Worker processes reconnect to the same file
+    def __getstate__(self):
+        return {'path': self.path, 'snapshot': self.snapshot, 'max_entries': self.max_entries}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['snapshot'], state['max_entries'])
+
+    def _connect(self):
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Used from the app's worker thread and shared between batch processes
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != str(MATCH_CACHE_VERSION):
+                with connection:
+                    connection.execute("DROP TABLE IF EXISTS results")
+                    connection.execute("DELETE FROM meta")
+                    connection.execute("INSERT INTO meta (key, value) VALUES ('version', ?)",
+                                       (str(MATCH_CACHE_VERSION),))
+            connection.execute("CREATE TABLE IF NOT EXISTS results (snapshot TEXT NOT NULL, query TEXT NOT NULL, "
+                               "matches TEXT NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (snapshot, query))")
+            connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            self._connection = connection
+            self._drop_other_snapshots(self.snapshot)
+        return self._connection
+
+    def _drop_other_snapshots(self, snapshot):
+        connection = self._connection
+        with connection:
+            deleted = connection.execute("DELETE FROM results WHERE snapshot != ?", (snapshot,)).rowcount
+        if deleted:
+            self.logger.info(f"Reference changed; dropped {deleted} older results from match cache {self.path}")
+
+    def set_snapshot(self, snapshot):
+        """Switch to a new reference snapshot, discarding results from older ones"""
+        with self._lock:
+            self.snapshot = snapshot
+            if self._connection is not None:
+                self._drop_other_snapshots(snapshot)
+
+    def get_many(self, queries, snapshot):
+        """Return {query: [(Network Number, MMS Id), ...]} for the queries cached under snapshot"""
+        found = {}
+        queries = list(queries)
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(queries), _BATCH_SIZE):
+                batch = queries[start:start + _BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = connection.execute(
+                    f"SELECT query, matches FROM results WHERE snapshot = ? AND query IN ({placeholders})",
+                    [snapshot] + batch,
+                ).fetchall()
+                for query, matches in rows:
+                    found[query] = [tuple(match) for match in json.loads(matches)]
+            if found:
+                # Refresh recency so repeat IDs survive eviction
+                now = time.time()
+                with connection:
+                    connection.executemany("UPDATE results SET last_used = ? WHERE snapshot = ? AND query = ?",
+                                           [(now, snapshot, query) for query in found])
+        return found
+
+    def put_many(self, results, snapshot):
+        """Store {query: [(Network Number, MMS Id), ...]} under snapshot and evict beyond max_entries"""
+        if not results:
+            return
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO results (snapshot, query, matches, last_used) VALUES (?, ?, ?, ?)",
+                    [(snapshot, query, json.dumps(matches), now) for query, matches in results.items()],
+                )
+                (count,) = connection.execute("SELECT COUNT(*) FROM results").fetchone()
+                if count > self.max_entries:
+                    connection.execute(
+                        "DELETE FROM results WHERE rowid IN "
+                        "(SELECT rowid FROM results ORDER BY last_used LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
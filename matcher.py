@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Reference matcher - an indexed replacement for the linear substring scan
+used to find an originating_system_id within the reference "Network Number"
+values.
+"""
+
+import copy
+from array import array
+from collections import defaultdict
+
+import pandas as pd
+
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+
+REFERENCE_COLUMNS = ('Network Number', 'MMS Id')
+
+
+def _csv_read_options(columns):
+    """Return pd.read_csv options for loading only columns, as compactly as available"""
+    if pyarrow is not None:
+        # Multithreaded parser and Arrow-backed strings instead of Python objects;
+        # typing the columns up front keeps Arrow from building and then
+        # converting numeric MMS Id columns
+        string_dtype = pd.ArrowDtype(pyarrow.string())
+        return {'usecols': list(columns), 'engine': 'pyarrow', 'dtype_backend': 'pyarrow',
+                'dtype': {column: string_dtype for column in columns}}
+    return {'usecols': list(columns), 'dtype': str}
+
+
+def read_reference_csv(csv_path, columns=REFERENCE_COLUMNS, optional_columns=()):
+    """Read only the given columns (and any optional_columns present) of the reference CSV, as strings"""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    for column in columns:
+        if column not in header:
+            raise ValueError(f"'{column}' column not found in reference CSV")
+    columns = list(columns) + [column for column in optional_columns if column in header]
+    return pd.read_csv(csv_path, **_csv_read_options(columns))
+
+
+def reference_pairs(reference_df):
+    """Flatten the reference DataFrame into unique (Network Number, MMS Id) tuples"""
+    frame = reference_df[list(REFERENCE_COLUMNS)].dropna()
+    network_nums = frame['Network Number']
+    mms_ids = frame['MMS Id']
+    # Check if values are not empty strings before stripping, as the row loop did
+    keep = (network_nums != '') & (network_nums != 'nan') & (mms_ids != '') & (mms_ids != 'nan')
+    frame = pd.DataFrame({
+        'Network Number': network_nums[keep].str.strip(),
+        'MMS Id': mms_ids[keep].str.strip(),
+    })
+    # Repeated pairs add nothing to the index (the first MMS Id per Network Number wins)
+    frame = frame.drop_duplicates()
+    return list(zip(frame['Network Number'].tolist(), frame['MMS Id'].tolist()))
+
+
+class ReferenceMatcher:
+    """
+    Answers "which Network Numbers contain this ID?" without scanning every
+    reference entry.
+
+    Each Network Number is split on ';' into tokens.  Tokens are kept in an
+    exact-match hash index, and an n-gram inverted index over the same tokens
+    finds IDs that only occur as a substring of a longer token (for example
+    'grinnell:108' inside 'grinnell:1080').  Results are identical to
+    ``[(n, m) for n, m in reference_data if orig_id in n]`` deduplicated by
+    Network Number, in reference order.
+    """
+
+    NGRAM = 3
+    # reference_snapshot() of the reference file version this index was
+    # loaded from; set by ReferenceCache and ReferenceWatcher, None if unknown
+    snapshot = None
+
+    def __init__(self, pairs):
+        # Unique Network Numbers in order of first appearance, each with the
+        # MMS Id of its first occurrence (mirrors the per-row dedupe dict)
+        self.network_numbers = []
+        self.mms_ids = []
+        self.entry_count = 0
+        self.net_ids = {}
+        for net_num, mms_id in pairs:
+            self.entry_count += 1
+            if net_num not in self.net_ids:
+                self.net_ids[net_num] = len(self.network_numbers)
+                self.network_numbers.append(net_num)
+                self.mms_ids.append(mms_id)
+
+        # Exact token -> Network Number ids
+        token_postings = defaultdict(list)
+        for net_id, net_num in enumerate(self.network_numbers):
+            for token in self._tokenize(net_num):
+                postings = token_postings[token]
+                if not postings or postings[-1] != net_id:
+                    postings.append(net_id)
+        self.token_index = dict(token_postings)
+        self.tokens = list(self.token_index)
+        self.token_ids = {token: token_id for token_id, token in enumerate(self.tokens)}
+
+        # n-gram -> token ids, for substring hits inside longer tokens.
+        # Postings are compact integer arrays so the index pickles quickly.
+        ngram_postings = defaultdict(list)
+        for token_id, token in enumerate(self.tokens):
+            for gram in self._ngrams(token):
+                ngram_postings[gram].append(token_id)
+        self.ngram_index = {gram: array('I', token_ids) for gram, token_ids in ngram_postings.items()}
+
+    @classmethod
+    def from_dataframe(cls, reference_df):
+        """Build a matcher from the reference DataFrame"""
+        return cls(reference_pairs(reference_df))
+
+    def __len__(self):
+        return self.entry_count
+
+    @staticmethod
+    def _tokenize(net_num):
+        return [token.strip() for token in net_num.split(';') if token.strip()]
+
+    @classmethod
+    def _ngrams(cls, text):
+        return {text[i:i + cls.NGRAM] for i in range(len(text) - cls.NGRAM + 1)}
+
+    def _candidate_tokens(self, query):
+        """Return ids of tokens that may contain query, using the n-gram index"""
+        grams = self._ngrams(query)
+        postings = []
+        for gram in grams:
+            token_ids = self.ngram_index.get(gram)
+            if not token_ids:
+                return set()
+            postings.append(token_ids)
+        # Intersect rarest first; once the set is small, verifying each
+        # candidate with a plain substring test is cheaper than intersecting
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for token_ids in postings[1:]:
+            if len(candidates) <= 32:
+                break
+            candidates.intersection_update(token_ids)
+        return candidates
+
+    def match_ids(self, query):
+        """Return sorted ids of Network Numbers that contain query"""
+        # IDs containing ';' or edge whitespace can span tokens, so scan the
+        # full Network Number strings (rare, and exact by construction)
+        if not query or ';' in query or query != query.strip():
+            return [net_id for net_id, net_num in enumerate(self.network_numbers)
+                    if net_num is not None and query in net_num]
+
+        net_ids = set(self.token_index.get(query, ()))
+        if len(query) < self.NGRAM:
+            token_ids = range(len(self.tokens))
+        else:
+            token_ids = self._candidate_tokens(query)
+        for token_id in token_ids:
+            token = self.tokens[token_id]
+            if token != query and query in token:
+                net_ids.update(self.token_index[token])
+        return sorted(net_ids)
+
+    def updated(self, pairs, patch_limit=0.2):
+        """
+        Return (matcher, patched) for a new version of the reference pairs.
+
+        The added, removed and changed Network Numbers are diffed against this
+        index and applied to a copy, leaving this matcher untouched for any
+        run still using it.  If more than patch_limit of the Network Numbers
+        were added or removed, a fresh matcher is built instead.  Patched
+        Network Numbers are appended, so the order of ambiguous match lists
+        may differ from a fresh build; the matches themselves do not.
+        """
+        pairs = list(pairs)
+        first_mms_ids = {}
+        for net_num, mms_id in pairs:
+            first_mms_ids.setdefault(net_num, mms_id)
+
+        added = [net_num for net_num in first_mms_ids if net_num not in self.net_ids]
+        removed = [net_num for net_num in self.net_ids if net_num not in first_mms_ids]
+        if len(added) + len(removed) > patch_limit * max(len(self.net_ids), 1):
+            return ReferenceMatcher(pairs), False
+
+        # Shallow copies; individual postings are copied only when modified
+        patched = copy.copy(self)
+        patched.network_numbers = list(self.network_numbers)
+        patched.mms_ids = list(self.mms_ids)
+        patched.net_ids = dict(self.net_ids)
+        patched.tokens = list(self.tokens)
+        patched.token_ids = dict(self.token_ids)
+        patched.token_index = dict(self.token_index)
+        patched.ngram_index = dict(self.ngram_index)
+        patched.entry_count = len(pairs)
+
+        # Gather the ids leaving and joining each posting first, so every
+        # touched posting is rebuilt once rather than once per Network Number
+        removed_ids = defaultdict(set)
+        for net_num in removed:
+            net_id = patched.net_ids.pop(net_num)
+            patched.network_numbers[net_id] = None
+            patched.mms_ids[net_id] = None
+            for token in set(self._tokenize(net_num)):
+                removed_ids[token].add(net_id)
+        for token, net_ids in removed_ids.items():
+            patched.token_index[token] = [i for i in patched.token_index[token] if i not in net_ids]
+
+        for net_num, net_id in patched.net_ids.items():
+            patched.mms_ids[net_id] = first_mms_ids[net_num]
+
+        added_net_ids = defaultdict(list)
+        added_token_ids = defaultdict(list)
+        for net_num in added:
+            net_id = len(patched.network_numbers)
+            patched.net_ids[net_num] = net_id
+            patched.network_numbers.append(net_num)
+            patched.mms_ids.append(first_mms_ids[net_num])
+            for token in dict.fromkeys(self._tokenize(net_num)):
+                if token not in patched.token_ids:
+                    token_id = len(patched.tokens)
+                    patched.tokens.append(token)
+                    patched.token_ids[token] = token_id
+                    for gram in self._ngrams(token):
+                        added_token_ids[gram].append(token_id)
+                added_net_ids[token].append(net_id)
+        for token, net_ids in added_net_ids.items():
+            patched.token_index[token] = patched.token_index.get(token, []) + net_ids
+        for gram, token_ids in added_token_ids.items():
+            patched.ngram_index[gram] = patched.ngram_index.get(gram, array('I')) + array('I', token_ids)
+
+        return patched, True
+
+    def match(self, query):
+        """Return unique (Network Number, MMS Id) matches for query, in reference order"""
+        return [(self.network_numbers[net_id], self.mms_ids[net_id]) for net_id in self.match_ids(query)]
+
+    def match_many(self, queries):
+        """Return {query: match(query)} for a batch of queries"""
+        return {query: self.match(query) for query in queries}
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Output writer - writes UPDATED_ CSVs through a large buffer into a temporary
+file beside the destination and renames it into place only once complete,
+so a crash or a dropped share never leaves a truncated UPDATED_ file.
+"""
+
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+except ImportError:
+    pyarrow = None
+
+
+# Write buffer size; large writes keep the number of round trips to a share low
+OUTPUT_BUFFER_BYTES = 4 * 1024 * 1024
+# Set ALMA_CSV_WRITER=pyarrow to write rows with the pyarrow CSV writer
+WRITER_ENV_VAR = "ALMA_CSV_WRITER"
+WRITERS = ('pandas', 'pyarrow')
+# Suffix of a streaming run's output while it is still being written
+PARTIAL_SUFFIX = ".partial"
+
+logger = logging.getLogger(__name__)
+
+
+def default_writer():
+    """Return the CSV writer selected by ALMA_CSV_WRITER, falling back to pandas"""
+    writer = os.environ.get(WRITER_ENV_VAR, "").strip().lower() or 'pandas'
+    if writer not in WRITERS:
+        logger.warning(f"⚠️  Unknown {WRITER_ENV_VAR} value '{writer}', using pandas")
+        return 'pandas'
+    if writer == 'pyarrow' and pyarrow is None:
+        logger.warning(f"⚠️  {WRITER_ENV_VAR}=pyarrow but pyarrow is not installed, using pandas")
+        return 'pandas'
+    return writer
+
+
+def partial_path(output_path):
+    """Return the file a streaming run writes before renaming it to output_path"""
+    output_path = Path(output_path)
+    return output_path.with_name(output_path.name + PARTIAL_SUFFIX)
+
+
+def open_output(path, mode='wb'):
+    """Open path as a binary stream with the large output buffer"""
+    return open(path, mode, buffering=OUTPUT_BUFFER_BYTES)
+
+
+def finish_output(output):
+    """Flush output all the way to disk, so a following rename cannot expose a partial file"""
+    output.flush()
+    os.fsync(output.fileno())
+
+
+@contextmanager
+def atomic_output(path):
+    """
+    Yield a buffered binary stream whose contents replace path only if the
+    block completes; on error the temporary file is removed and path is
+    left as it was.
+    """
+    path = Path(path)
+    # Opened normally rather than with mkstemp so the file gets the usual permissions
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open_output(tmp_path, 'xb') as output:
+            yield output
+            finish_output(output)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+
+def write_frame(df, output, header=True, writer=None):
+    """
+    Write df as CSV rows to the binary stream output.
+
+    The pandas writer matches DataFrame.to_csv(path, index=False).  The
+    pyarrow writer is faster on large frames but quotes every text value
+    and formats floats its own way.  The header line is written by pandas
+    either way.
+    """
+    writer = writer or default_writer()
+    if writer != 'pyarrow':
+        df.to_csv(output, header=header, index=False, mode='wb', encoding='utf-8')
+        return
+    if header:
+        df.head(0).to_csv(output, index=False, mode='wb', encoding='utf-8')
+    if len(df):
+        try:
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+        except pyarrow.ArrowException as e:
+            # e.g. a column mixing numbers and text; nothing has been written yet
+            logger.warning(f"⚠️  pyarrow cannot convert this frame ({str(e)}), writing it with pandas")
+            df.to_csv(output, header=False, index=False, mode='wb', encoding='utf-8')
+            return
+        pyarrow_csv.write_csv(table, output, pyarrow_csv.WriteOptions(include_header=False))
+
+
+def write_csv(df, path, writer=None):
+    """Write df to path atomically through the output buffer; returns the bytes written"""
+    with atomic_output(path) as output:
+        write_frame(df, output, writer=writer)
+        return output.tell()
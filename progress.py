@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Progress reporting - a time-throttled, cancellable progress callback that
+keeps UI updates from costing more than the work they report.
+"""
+
+import threading
+import time
+
+
+class ProcessingCancelled(Exception):
+    """Raised from a progress callback when the user cancels a run"""
+
+
+def format_duration(seconds):
+    """Format a number of seconds as H:MM:SS or M:SS"""
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class ThrottledProgress:
+    """
+    Progress callback for core.process_file and friends.
+
+    Called as progress(message, done=None, total=None).  Stage messages
+    (no done count) are always published; counted updates are published at
+    most max_rate times per second with a rate and, when total is known, an
+    ETA.  Every call is also a cancellation point.
+    """
+
+    def __init__(self, publish, max_rate=10):
+        self.publish = publish
+        self.min_interval = 1.0 / max_rate
+        self.cancel_event = threading.Event()
+        self.last_published = 0.0
+        # Start time and last count of the current counted stage
+        self.count_started = None
+        self.last_done = 0
+
+    def cancel(self):
+        """Request cancellation; the worker stops at its next progress call"""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def __call__(self, message, done=None, total=None):
+        if self.cancel_event.is_set():
+            raise ProcessingCancelled("Processing cancelled")
+
+        now = time.monotonic()
+        if done is not None:
+            # A count that goes backwards starts a new stage (e.g. the next file)
+            if self.count_started is None or done < self.last_done:
+                self.count_started = now
+            self.last_done = done
+            if now - self.last_published < self.min_interval:
+                return
+            elapsed = now - self.count_started
+            if elapsed > 0 and done > 0:
+                rate = done / elapsed
+                message = f"{message} ({rate:,.0f}/sec"
+                if total:
+                    message += f", ETA {format_duration((total - done) / rate)}"
+                message += ")"
+        self.last_published = now
+        self.publish(message)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Reference cache - keeps a compiled copy of the reference CSV on local disk so
+that startup does not re-read and re-parse the file over the network share
+when it has not changed.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from companion_index import COMPANION_COLUMNS, CompanionIndex
+from instrumentation import RunMetrics
+from mapped_index import MappedReferenceIndex, write_mapped_index
+from match_cache import reference_snapshot
+from matcher import ReferenceMatcher, read_reference_csv
+
+
+# Bump whenever the pickled matcher layout changes
+CACHE_VERSION = 2
+# Bump whenever the pickled CompanionIndex layout changes
+COMPANION_CACHE_VERSION = 1
+
+
+def file_fingerprint(path, with_hash=False):
+    """Return the size/mtime (and optionally sha256) identifying a file's contents"""
+    stat = os.stat(path)
+    fingerprint = {
+        'path': str(Path(path).resolve()),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        fingerprint['sha256'] = digest.hexdigest()
+    return fingerprint
+
+
+class ReferenceCache:
+    """Local on-disk cache of the parsed reference and its lookup index"""
+
+    def __init__(self, cache_dir="cache", verify_hash=False, mapped=False, companion=False):
+        self.cache_dir = Path(cache_dir)
+        # Hashing reads the whole file, so it is opt-in for slow shares
+        self.verify_hash = verify_hash
+        # Store a binary index that is memory-mapped on load instead of a pickle
+        self.mapped = mapped
+        # Also build and cache the CompanionIndex whenever the CSV is read
+        self.companion = companion
+        # (source path, fingerprint, CompanionIndex) from the last read of the CSV
+        self._built_companion = None
+        self.logger = logging.getLogger(__name__)
+
+    def _source_key(self, source_path):
+        return hashlib.sha1(str(Path(source_path).resolve()).encode('utf-8')).hexdigest()[:16]
+
+    def cache_path(self, source_path):
+        """Return the cache file used for a given reference CSV"""
+        suffix = "idx" if self.mapped else "pickle"
+        return self.cache_dir / f"reference_{self._source_key(source_path)}.{suffix}"
+
+    def companion_path(self, source_path):
+        """Return the cache file used for a given reference CSV's CompanionIndex"""
+        return self.cache_dir / f"reference_{self._source_key(source_path)}.companion.pickle"
+
+    def load(self, source_path, fingerprint=None):
+        """Return the cached matcher if it matches the source file, else None"""
+        cache_file = self.cache_path(source_path)
+        if not cache_file.exists():
+            return None
+        if fingerprint is None:
+            fingerprint = file_fingerprint(source_path, with_hash=self.verify_hash)
+        try:
+            if self.mapped:
+                index = MappedReferenceIndex(cache_file)
+                cached = dict(index.metadata, matcher=index)
+            else:
+                with open(cache_file, 'rb') as f:
+                    cached = pickle.load(f)
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable reference cache {cache_file}: {str(e)}")
+            return None
+        if cached.get('version') != CACHE_VERSION or cached.get('fingerprint') != fingerprint:
+            self.logger.info(f"Reference cache is stale: {cache_file}")
+            return None
+        matcher = cached['matcher']
+        matcher.snapshot = reference_snapshot(fingerprint)
+        return matcher
+
+    def load_companion(self, source_path, fingerprint=None):
+        """Return the cached CompanionIndex if it matches the source file, else None"""
+        cache_file = self.companion_path(source_path)
+        if not cache_file.exists():
+            return None
+        if fingerprint is None:
+            fingerprint = file_fingerprint(source_path, with_hash=self.verify_hash)
+        try:
+            with open(cache_file, 'rb') as f:
+                cached = pickle.load(f)
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable companion cache {cache_file}: {str(e)}")
+            return None
+        if cached.get('version') != COMPANION_CACHE_VERSION or cached.get('fingerprint') != fingerprint:
+            self.logger.info(f"Companion cache is stale: {cache_file}")
+            return None
+        return cached['companion']
+
+    def _write_atomically(self, cache_file, write):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            # Processes that mapped the previous file keep reading it until they reopen
+            os.replace(tmp_path, cache_file)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def store(self, source_path, matcher, fingerprint):
+        """Write the matcher to the cache, replacing any previous copy atomically"""
+        cache_file = self.cache_path(source_path)
+
+        def write(f):
+            if self.mapped:
+                write_mapped_index(matcher, f, {'version': CACHE_VERSION, 'fingerprint': fingerprint})
+            else:
+                pickle.dump(
+                    {'version': CACHE_VERSION, 'fingerprint': fingerprint, 'matcher': matcher},
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+
+        self._write_atomically(cache_file, write)
+        self.logger.info(f"Reference cache written: {cache_file}")
+
+    def store_companion(self, source_path, companion, fingerprint):
+        """Write the CompanionIndex to the cache, replacing any previous copy atomically"""
+        cache_file = self.companion_path(source_path)
+        self._write_atomically(cache_file, lambda f: pickle.dump(
+            {'version': COMPANION_CACHE_VERSION, 'fingerprint': fingerprint, 'companion': companion},
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        ))
+        self.logger.info(f"Companion cache written: {cache_file}")
+
+    def build_companion(self, source_path, reference_df, fingerprint, metrics=None):
+        """Build the CompanionIndex from an already read reference DataFrame and cache it"""
+        metrics = metrics if metrics is not None else RunMetrics()
+        with metrics.span('companion_build'):
+            companion = CompanionIndex.from_dataframe(reference_df)
+        self._built_companion = (str(source_path), fingerprint, companion)
+        try:
+            with metrics.span('companion_cache_store'):
+                self.store_companion(source_path, companion, fingerprint)
+        except Exception as e:
+            self.logger.warning(f"Could not write companion cache: {str(e)}")
+        return companion
+
+    def load_or_build(self, source_path, use_cache=True, metrics=None):
+        """
+        Return (matcher, from_cache), parsing the CSV only when the cache is
+        stale.  With use_cache=False the CSV is always parsed and the cache
+        refreshed.  Stage timings are added to metrics if given.
+        """
+        metrics = metrics if metrics is not None else RunMetrics()
+        # Fingerprint before reading so a file replaced mid-read is caught next time
+        fingerprint = file_fingerprint(source_path, with_hash=self.verify_hash)
+        with metrics.span('reference_cache_load'):
+            matcher = self.load(source_path, fingerprint) if use_cache else None
+        if matcher is not None:
+            metrics.count('reference_cache_hits')
+            self.logger.info(f"Reference loaded from cache: {self.cache_path(source_path)}")
+            return matcher, True
+
+        metrics.count('reference_cache_misses')
+        with metrics.span('reference_read'):
+            # The companion columns come from the same read, never a second scan
+            reference_df = read_reference_csv(source_path,
+                                              optional_columns=COMPANION_COLUMNS if self.companion else ())
+        self.logger.info(f"Reference CSV columns: {list(reference_df.columns)}")
+        with metrics.span('index_build'):
+            matcher = ReferenceMatcher.from_dataframe(reference_df)
+        matcher.snapshot = reference_snapshot(fingerprint)
+        if self.companion:
+            self.build_companion(source_path, reference_df, fingerprint, metrics)
+            del reference_df
+        try:
+            with metrics.span('reference_cache_store'):
+                self.store(source_path, matcher, fingerprint)
+        except Exception as e:
+            # A cache that cannot be written only costs speed on the next start
+            self.logger.warning(f"Could not write reference cache: {str(e)}")
+            return matcher, False
+        if self.mapped:
+            # Query the mapping rather than the in-memory copy so it can be freed
+            matcher = self.load(source_path, fingerprint) or matcher
+        return matcher, False
+
+    def load_or_build_companion(self, source_path, use_cache=True, metrics=None):
+        """
+        Return the CompanionIndex for the reference CSV.  One built by the
+        preceding load_or_build read of the same file is reused; otherwise
+        the companion cache is tried before reading the CSV.
+        """
+        metrics = metrics if metrics is not None else RunMetrics()
+        fingerprint = file_fingerprint(source_path, with_hash=self.verify_hash)
+        if self._built_companion is not None and self._built_companion[:2] == (str(source_path), fingerprint):
+            return self._built_companion[2]
+        with metrics.span('companion_cache_load'):
+            companion = self.load_companion(source_path, fingerprint) if use_cache else None
+        if companion is not None:
+            metrics.count('companion_cache_hits')
+            self.logger.info(f"Companion index loaded from cache: {self.companion_path(source_path)}")
+            return companion
+
+        metrics.count('companion_cache_misses')
+        with metrics.span('reference_read'):
+            reference_df = read_reference_csv(source_path, optional_columns=COMPANION_COLUMNS)
+        return self.build_companion(source_path, reference_df, fingerprint, metrics)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Reference watcher - polls the reference CSV for changes and hot-swaps a
+patched lookup index so long-running sessions pick up new Alma exports
+without a restart.
+"""
+
+import logging
+import threading
+
+from companion_index import COMPANION_COLUMNS
+from match_cache import reference_snapshot
+from matcher import read_reference_csv, reference_pairs
+from reference_cache import ReferenceCache, file_fingerprint
+
+
+class ReferenceWatcher:
+    """
+    Background poller that reloads the reference CSV when its size or mtime
+    changes.
+
+    A change is only acted on once two consecutive polls agree, so a file
+    that is still being copied onto the share is not read half-written.  The
+    new index is built off to the side (patched from the current one where
+    possible) and published by replacing ``self.matcher`` in one assignment;
+    runs that already hold the previous matcher keep a consistent snapshot.
+    """
+
+    def __init__(self, csv_path, matcher, on_reload=None, cache=None, interval=30.0, fingerprint=None):
+        self.csv_path = csv_path
+        self.matcher = matcher
+        self.on_reload = on_reload
+        self.cache = cache if cache is not None else ReferenceCache()
+        self.interval = interval
+        self.fingerprint = fingerprint or file_fingerprint(csv_path, with_hash=self.cache.verify_hash)
+        self.pending_fingerprint = None
+        self.logger = logging.getLogger(__name__)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start polling on a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="reference-watcher", daemon=True)
+            self._thread.start()
+            self.logger.info(f"Watching reference CSV for changes every {self.interval:.0f}s: {self.csv_path}")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check_now()
+            except Exception as e:
+                # The share may be temporarily unavailable; keep the current index
+                self.logger.warning(f"Reference reload check failed: {str(e)}")
+
+    def check_now(self):
+        """Poll once; return True if a new index was swapped in"""
+        fingerprint = file_fingerprint(self.csv_path, with_hash=self.cache.verify_hash)
+        if fingerprint == self.fingerprint:
+            self.pending_fingerprint = None
+            return False
+        if fingerprint != self.pending_fingerprint:
+            # Wait for the file to settle before reading it
+            self.pending_fingerprint = fingerprint
+            self.logger.info(f"Reference CSV change detected: {self.csv_path}")
+            return False
+
+        self.reload(fingerprint)
+        return True
+
+    def reload(self, fingerprint):
+        """Re-read the reference and swap in an updated index"""
+        self.logger.info(f"Reloading reference CSV: {self.csv_path}")
+        # The companion columns come from the same read when they are in use
+        reference_df = read_reference_csv(self.csv_path,
+                                          optional_columns=COMPANION_COLUMNS if self.cache.companion else ())
+        pairs = reference_pairs(reference_df)
+        if self.cache.companion:
+            self.cache.build_companion(self.csv_path, reference_df, fingerprint)
+        del reference_df
+        matcher, patched = self.matcher.updated(pairs)
+        matcher.snapshot = reference_snapshot(fingerprint)
+
+        # Atomic publish: readers see either the old or the new index
+        self.matcher = matcher
+        self.fingerprint = fingerprint
+        self.pending_fingerprint = None
+        self.logger.info(f"Reference index {'patched' if patched else 'rebuilt'}: {len(matcher)} entries")
+
+        try:
+            self.cache.store(self.csv_path, matcher, fingerprint)
+        except Exception as e:
+            self.logger.warning(f"Could not write reference cache: {str(e)}")
+        else:
+            if self.cache.mapped:
+                # Serve lookups from the new mapping instead of the in-memory patch or rebuild
+                self.matcher = self.cache.load(self.csv_path, fingerprint) or matcher
+                matcher = self.matcher
+
+        if self.on_reload is not None:
+            self.on_reload(matcher, patched)
@@ -0,0 +1,133 @@
+"""
+Interrupted checkpointed streaming runs: a resumed run must produce the
+same bytes and counts as one that was never interrupted, and a checkpoint
+written against another reference or extra-column setting must be ignored.
+"""
+
+import csv
+
+import pandas as pd
+import pytest
+
+from companion_index import CompanionIndex
+from core import process_file_streaming, updated_output_path
+from matcher import ReferenceMatcher
+
+
+CHUNKSIZE = 17
+REFERENCE = [(f"grinnell:{i}; dg_{i * 7}", str(991000 + i), f"objects/{i}.tif", "Deleted" if i % 9 == 0 else "Active")
+             for i in range(1, 120)]
+
+
+class Interrupted(Exception):
+    pass
+
+
+def write_input(path):
+    rows = [("title", "originating_system_id", "mms_id", "date")]
+    for i in range(1, 200):
+        if i % 23 == 0:
+            rows.append(("", "", "", ""))
+        elif i % 31 == 0:
+            rows.append((f"# comment {i}", f"grinnell:{i}", "", ""))
+        elif i % 13 == 0:
+            rows.append((f"Missing {i}", f"missing:{i}", "", "0012"))
+        elif i % 11 == 0:
+            rows.append((f"Prefilled {i}", f"grinnell:{i}", "991999", ""))
+        else:
+            # grinnell:1 .. grinnell:9 are ambiguous; the rest resolve
+            rows.append((f"Photo é {i}", f"grinnell:{i % 130}", "", "1.50"))
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(rows)
+
+
+@pytest.fixture
+def reference():
+    matcher = ReferenceMatcher([(net_num, mms_id) for net_num, mms_id, _, _ in REFERENCE])
+    matcher.snapshot = "reference-a"
+    companion = CompanionIndex.from_dataframe(pd.DataFrame(
+        REFERENCE, columns=['Network Number', 'MMS Id', 'File Internal Path', 'Bibliographic Lifecycle']))
+    return matcher, companion
+
+
+def full_run(tmp_path, matcher, companion=None, timestamp="T1"):
+    """Return the output bytes and counts of an uninterrupted run"""
+    input_path = tmp_path / "expected" / "input.csv"
+    input_path.parent.mkdir(exist_ok=True)
+    write_input(input_path)
+    result = process_file_streaming(input_path, matcher, timestamp=timestamp, chunksize=CHUNKSIZE,
+                                    companion=companion)
+    return result.output_path.read_bytes(), result.counts()
+
+
+def interrupt(input_path, matcher, after_chunks, companion=None):
+    """Run with a checkpoint and stop after after_chunks chunks, leaving stray bytes in the partial output"""
+    def progress(message, done=None, total=None):
+        if done is not None:
+            progress.chunks += 1
+            if progress.chunks == after_chunks:
+                with open(str(updated_output_path(input_path)) + ".partial", 'a', encoding='utf-8') as f:
+                    f.write("half,written,row")
+                raise Interrupted()
+    progress.chunks = 0
+
+    with pytest.raises(Interrupted):
+        process_file_streaming(input_path, matcher, progress=progress, timestamp="T1", chunksize=CHUNKSIZE,
+                               checkpoint=True, companion=companion)
+    assert not updated_output_path(input_path).exists()
+
+
+def resume(input_path, matcher, companion=None):
+    """Run again with a checkpoint; return the output bytes, counts and whether it resumed"""
+    messages = []
+    result = process_file_streaming(input_path, matcher, progress=lambda message, *args: messages.append(message),
+                                    timestamp="T2", chunksize=CHUNKSIZE, checkpoint=True, companion=companion)
+    resumed = any(message.startswith("Resuming") for message in messages)
+    # A finished run leaves no checkpoint behind
+    assert not list(input_path.parent.glob("*.checkpoint"))
+    return result.output_path.read_bytes(), result.counts(), resumed
+
+
+@pytest.mark.parametrize('after_chunks', [1, 5, 11])
+def test_resumed_run_matches_uninterrupted_run(tmp_path, reference, after_chunks):
+    matcher, _ = reference
+    expected_bytes, expected_counts = full_run(tmp_path, matcher)
+    input_path = tmp_path / "input.csv"
+    write_input(input_path)
+
+    interrupt(input_path, matcher, after_chunks)
+    output, counts, resumed = resume(input_path, matcher)
+
+    assert resumed
+    # The interrupted run's NOT FOUND timestamp is kept
+    assert output == expected_bytes
+    assert counts == expected_counts
+
+
+def test_changed_reference_restarts(tmp_path, reference):
+    matcher, _ = reference
+    input_path = tmp_path / "input.csv"
+    write_input(input_path)
+    interrupt(input_path, matcher, 3)
+
+    matcher.snapshot = "reference-b"
+    output, counts, resumed = resume(input_path, matcher)
+
+    assert not resumed
+    assert (output, counts) == full_run(tmp_path, matcher, timestamp="T2")
+
+
+@pytest.mark.parametrize('interrupted_with_companion', [False, True])
+def test_changed_extra_columns_restarts(tmp_path, reference, interrupted_with_companion):
+    matcher, companion = reference
+    input_path = tmp_path / "input.csv"
+    write_input(input_path)
+    interrupt(input_path, matcher, 3, companion if interrupted_with_companion else None)
+
+    resumed_companion = None if interrupted_with_companion else companion
+    output, counts, resumed = resume(input_path, matcher, resumed_companion)
+
+    assert not resumed
+    assert (output, counts) == full_run(tmp_path, matcher, resumed_companion, timestamp="T2")
+    widths = {len(row) for row in csv.reader(output.decode('utf-8').splitlines())}
+    assert widths == {6 if resumed_companion else 4}
@@ -0,0 +1,110 @@
+"""
+The lookup service on localhost: /lookup statuses, RemoteMatcher against
+the local matcher, and /process output against a local run.
+"""
+
+import csv
+import http.client
+import json
+import threading
+
+import pytest
+
+import core
+from lookup_service import LookupServer, RemoteMatcher
+from matcher import ReferenceMatcher
+from reference_cache import ReferenceCache
+from reference_watch import ReferenceWatcher
+
+
+REFERENCE = [
+    ("grinnell:108; dg_1", "9910801"),
+    ("grinnell:1080", "9910802"),
+    ("dg_2; http://hdl.handle.net/11084/2", "9920001"),
+    ("dg_2; http://hdl.handle.net/11084/2", "9920002"),
+    ("中文:7", "9970001"),
+]
+QUERIES = ["grinnell:108", "grinnell:1080", "dg_2", "中文:7", "missing", "dg_"]
+INPUT_ROWS = [
+    ("title", "originating_system_id", "mms_id"),
+    ("# comment row", "grinnell:108", ""),
+    ("Ambiguous", "grinnell:108", ""),
+    ("Matched", "grinnell:1080", ""),
+    ("Matched again", "dg_2", "NOT FOUND IN ALMA - 2025-01-01 00:00:00"),
+    ("Non-ASCII", "中文:7", ""),
+    ("Not found", "missing", ""),
+    ("Already set", "dg_2", "991234"),
+    ("No ID", "", ""),
+]
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(rows)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    # Fixed NOT FOUND timestamp so the service and local runs can be compared
+    monkeypatch.setattr(core, 'not_found_timestamp', lambda: "2026-01-01 00:00:00")
+    reference_path = tmp_path / "reference.csv"
+    write_csv(reference_path, [("Network Number", "MMS Id")] + REFERENCE)
+    matcher = ReferenceMatcher(REFERENCE)
+    watcher = ReferenceWatcher(reference_path, matcher, cache=ReferenceCache(tmp_path / "cache"))
+    server = LookupServer(("127.0.0.1", 0), watcher)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield matcher, f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_lookup_statuses(service):
+    _, url = service
+    results = RemoteMatcher(url).lookup(QUERIES)
+    assert [result['id'] for result in results] == QUERIES
+    assert [result['status'] for result in results] == [
+        "ambiguous", "matched", "matched", "matched", "not_found", "ambiguous"]
+    assert [result['mms_id'] for result in results] == [None, "9910802", "9920001", "9970001", None, None]
+
+
+def test_bad_lookup_is_rejected(service):
+    _, url = service
+    remote = RemoteMatcher(url)
+    with pytest.raises(RuntimeError, match="400"):
+        remote._request("POST", "/lookup", {'ids': "grinnell:108"})
+    with pytest.raises(RuntimeError, match="404"):
+        remote._request("GET", "/nowhere")
+
+
+def test_remote_match_many_equals_local(service):
+    matcher, url = service
+    remote = RemoteMatcher(url)
+    assert remote.match_many(QUERIES) == matcher.match_many(QUERIES)
+    assert remote.match("grinnell:108") == matcher.match("grinnell:108")
+    assert len(remote) == len(matcher)
+
+
+def test_process_equals_local_run(service, tmp_path):
+    matcher, url = service
+    input_path = tmp_path / "input.csv"
+    write_csv(input_path, INPUT_ROWS)
+    local = core.process_file(input_path, matcher)
+
+    port = int(url.rsplit(":", 1)[1])
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("POST", "/process", body=input_path.read_bytes(),
+                           headers={"Content-Type": "text/csv", "X-Filename": "input.csv"})
+        response = connection.getresponse()
+        body = response.read()
+    finally:
+        connection.close()
+
+    assert response.status == 200
+    assert body == local.output_path.read_bytes()
+    assert json.loads(response.getheader("X-Alma-Counts")) == local.counts()
+    assert local.counts()['updated'] == 3
+    assert b"NOT FOUND IN ALMA - 2026-01-01 00:00:00" in body
@@ -0,0 +1,67 @@
+"""
+MatchCache keeps each result with the reference snapshot it came from and
+evicts the least recently used IDs.
+"""
+
+import itertools
+import sqlite3
+
+import pytest
+
+import match_cache
+from match_cache import MatchCache
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Strictly increasing last_used times, however fast the test runs
+    ticks = itertools.count(1)
+    monkeypatch.setattr(match_cache.time, 'time', lambda: float(next(ticks)))
+
+
+def stored_snapshots(path):
+    with sqlite3.connect(path) as connection:
+        return {snapshot for (snapshot,) in connection.execute("SELECT DISTINCT snapshot FROM results")}
+
+
+def test_results_are_kept_per_snapshot(tmp_path):
+    cache = MatchCache(tmp_path / "matches.sqlite3", "a")
+    cache.put_many({'grinnell:108': [("grinnell:108", "991"), ("grinnell:1080", "992")],
+                    'missing': []}, "a")
+
+    # A run still holding reference b gets nothing stored under a
+    assert cache.get_many(['grinnell:108', 'missing'], "b") == {}
+
+    cache.put_many({'grinnell:108': [("grinnell:108", "993")]}, "b")
+    assert cache.get_many(['grinnell:108', 'missing'], "a") == {
+        'grinnell:108': [("grinnell:108", "991"), ("grinnell:1080", "992")], 'missing': []}
+    assert cache.get_many(['grinnell:108', 'missing'], "b") == {'grinnell:108': [("grinnell:108", "993")]}
+    cache.close()
+
+
+def test_new_snapshot_drops_older_results(tmp_path):
+    path = tmp_path / "matches.sqlite3"
+    cache = MatchCache(path, "a")
+    cache.put_many({'dg_1': [("dg_1", "991")]}, "a")
+    cache.close()
+
+    reopened = MatchCache(path, "b")
+    assert reopened.get_many(['dg_1'], "a") == {}
+    assert stored_snapshots(path) == set()
+
+    reopened.put_many({'dg_1': [("dg_1", "992")]}, "b")
+    reopened.set_snapshot("c")
+    assert stored_snapshots(path) == set()
+    reopened.close()
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = MatchCache(tmp_path / "matches.sqlite3", "a", max_entries=3)
+    for query in ('dg_1', 'dg_2', 'dg_3'):
+        cache.put_many({query: [(query, "991")]}, "a")
+    # Reading dg_1 makes dg_2 the least recently used
+    assert cache.get_many(['dg_1'], "a") == {'dg_1': [('dg_1', "991")]}
+    cache.put_many({'dg_4': [('dg_4', "991")], 'dg_5': []}, "a")
+
+    assert sorted(cache.get_many(['dg_1', 'dg_2', 'dg_3', 'dg_4', 'dg_5'], "a")) == ['dg_1', 'dg_4', 'dg_5']
+    cache.close()
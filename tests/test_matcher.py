@@ -0,0 +1,180 @@
+"""
+Randomized checks that the indexed matchers return exactly what the
+original linear scan did: every Network Number containing the ID, once
+each, in reference order, with the MMS Id of its first occurrence.
+"""
+
+import os
+import pickle
+import random
+import time
+
+import pytest
+
+from mapped_index import MappedReferenceIndex, write_mapped_index
+from matcher import ReferenceMatcher
+
+
+# Characters that exercise tokenizing, short IDs and multi-byte UTF-8
+ALPHABET = "ab1290:; -é中"
+SEEDS = range(20)
+
+
+def naive_match(pairs, query):
+    first = {}
+    for net_num, mms_id in pairs:
+        first.setdefault(net_num, mms_id)
+    return [(net_num, mms_id) for net_num, mms_id in first.items() if query in net_num]
+
+
+def random_text(rng, low, high):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(low, high)))
+
+
+def random_pairs(rng, count):
+    pairs = []
+    for _ in range(count):
+        tokens = [f"grinnell:{rng.randint(1, 300)}" if rng.random() < 0.5 else random_text(rng, 1, 8)
+                  for _ in range(rng.randint(1, 3))]
+        net_num = rng.choice(["; ", ";", " ; "]).join(tokens).strip()
+        if not net_num:
+            continue
+        pairs.append((net_num, str(rng.randint(1, 10 ** 12))))
+        if rng.random() < 0.1:
+            # Repeated Network Number with a different MMS Id; the first one wins
+            pairs.append((net_num, str(rng.randint(1, 10 ** 12))))
+    return pairs
+
+
+def random_queries(rng, pairs, count):
+    queries = ["", " ", ";", "中", "é1"]
+    for _ in range(count):
+        net_num = rng.choice(pairs)[0]
+        start = rng.randrange(len(net_num))
+        queries.append(net_num[start:start + rng.randint(1, 12)])
+        queries.append(random_text(rng, 1, 4))
+        queries.append(f"grinnell:{rng.randint(1, 300)}")
+    return queries
+
+
+@pytest.fixture(params=SEEDS)
+def reference(request):
+    rng = random.Random(request.param)
+    pairs = random_pairs(rng, 200)
+    return rng, pairs, random_queries(rng, pairs, 150)
+
+
+def test_reference_matcher_matches_linear_scan(reference):
+    _, pairs, queries = reference
+    matcher = ReferenceMatcher(pairs)
+    for query in queries:
+        assert matcher.match(query) == naive_match(pairs, query), query
+
+
+def test_mapped_index_matches_linear_scan(reference, tmp_path):
+    _, pairs, queries = reference
+    path = tmp_path / "reference.idx"
+    with open(path, 'wb') as f:
+        write_mapped_index(ReferenceMatcher(pairs), f)
+    index = MappedReferenceIndex(path)
+    for query in queries:
+        assert index.match(query) == naive_match(pairs, query), query
+
+
+def changed_pairs(rng, pairs, changes):
+    """Drop, add and re-point some Network Numbers of pairs"""
+    changed = [pair for pair in pairs if rng.random() > changes]
+    changed += random_pairs(rng, int(len(pairs) * changes))
+    return [(net_num, str(rng.randint(1, 10 ** 12)) if rng.random() < changes else mms_id)
+            for net_num, mms_id in changed]
+
+
+@pytest.mark.parametrize('changes', [0.02, 0.5])
+def test_updated_matches_linear_scan(reference, tmp_path, changes):
+    rng, pairs, queries = reference
+    new_pairs = changed_pairs(rng, pairs, changes)
+    queries = queries + random_queries(rng, new_pairs, 50)
+
+    matcher = ReferenceMatcher(pairs)
+    path = tmp_path / "reference.idx"
+    with open(path, 'wb') as f:
+        write_mapped_index(matcher, f)
+    for original in (matcher, MappedReferenceIndex(path)):
+        updated, _ = original.updated(new_pairs)
+        for query in queries:
+            # A patched index may order ambiguous matches differently
+            assert sorted(updated.match(query)) == sorted(naive_match(new_pairs, query)), query
+        # The original index is left as it was for runs still using it
+        assert original.match(queries[-1]) == naive_match(pairs, queries[-1])
+
+        # As the reference watcher does, write the updated index to a new mapping
+        updated_path = tmp_path / "updated.idx"
+        with open(updated_path, 'wb') as f:
+            write_mapped_index(updated, f)
+        remapped = MappedReferenceIndex(updated_path)
+        for query in queries:
+            assert sorted(remapped.match(query)) == sorted(naive_match(new_pairs, query)), query
+
+
+def test_small_changes_are_patched(reference, tmp_path):
+    rng, pairs, queries = reference
+    path = tmp_path / "reference.idx"
+    matcher = ReferenceMatcher(pairs)
+    with open(path, 'wb') as f:
+        write_mapped_index(matcher, f)
+    for original in (matcher, MappedReferenceIndex(path)):
+        versions = [pairs]
+        current = original
+        # Patch a patched index again
+        for _ in range(2):
+            versions.append(changed_pairs(rng, versions[-1], 0.02))
+            current, patched = current.updated(versions[-1])
+            assert patched
+        for query in queries:
+            assert sorted(current.match(query)) == sorted(naive_match(versions[-1], query)), query
+
+
+def test_patch_is_cheaper_than_rebuild():
+    # Common trigrams ("gri", "ll:") have postings covering nearly every token,
+    # so a patch that recopied them per added token would lose to a rebuild
+    def refs(start, stop):
+        return [(f"grinnell:{i}; gcrs:{i * 7}", str(10 ** 12 + i)) for i in range(start, stop)]
+
+    count = 50000
+    matcher = ReferenceMatcher(refs(0, count))
+    new_pairs = refs(0, count) + refs(count, count + count // 10)
+
+    start = time.perf_counter()
+    updated, patched = matcher.updated(new_pairs)
+    patch_time = time.perf_counter() - start
+    start = time.perf_counter()
+    ReferenceMatcher(new_pairs)
+    rebuild_time = time.perf_counter() - start
+
+    assert patched
+    assert patch_time < rebuild_time
+    assert updated.match(f"grinnell:{count + 1}") == [(f"grinnell:{count + 1}; gcrs:{(count + 1) * 7}",
+                                                         str(10 ** 12 + count + 1))]
+
+
+def test_unpickled_index_must_be_the_loaded_file(tmp_path):
+    pairs = [("grinnell:108", "991"), ("grinnell:1080", "992")]
+    path = tmp_path / "reference.idx"
+    with open(path, 'wb') as f:
+        write_mapped_index(ReferenceMatcher(pairs), f, {'fingerprint': {'size': 1}})
+    index = MappedReferenceIndex(path)
+    index.snapshot = "reference-a"
+
+    # As a spawned worker receives it
+    state = pickle.dumps(index)
+    copy = pickle.loads(state)
+    assert copy.snapshot == "reference-a"
+    assert copy.match("grinnell:108") == index.match("grinnell:108")
+
+    # Another run replaces the cache file before the worker opens it
+    replacement = tmp_path / "replacement.idx"
+    with open(replacement, 'wb') as f:
+        write_mapped_index(ReferenceMatcher(pairs[1:]), f, {'fingerprint': {'size': 2}})
+    os.replace(replacement, path)
+    with pytest.raises(ValueError, match="replaced"):
+        pickle.loads(state)